@@ -0,0 +1,108 @@
+"""Микробенчмарк: разбор callback_data цепочкой if/elif и через маршрутизатор
+(обработчик меню или кнопка вопроса из таблицы callback_data опроса).
+
+Запуск из корня проекта: python benchmarks/bench_callback_router.py
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Бот при импорте создает логи, журнал шагов и архив версий опросов - уводим их во временный каталог
+_workdir = tempfile.mkdtemp(prefix='survey_bench_')
+atexit.register(shutil.rmtree, _workdir, True)
+os.environ['LOG_DIR'] = _workdir
+os.environ['OUTBOX_PATH'] = os.path.join(_workdir, 'outbox.sqlite3')
+os.environ['SESSIONS_PATH'] = os.path.join(_workdir, 'sessions.sqlite3')
+os.environ['SURVEY_EVENTS_PATH'] = ''
+os.environ['SURVEY_VERSIONS_DIR'] = os.path.join(_workdir, 'survey_versions')
+
+from bot import CALLBACK_HANDLERS, MENU_CALLBACKS, parse_callback_data, surveys
+
+SURVEY = surveys.default
+
+
+def legacy_dispatch(data: str) -> str:
+    """Цепочка сравнений из прежней версии handle_button_click"""
+    if data == "main_menu":
+        return 'main_menu'
+    elif data == "start_survey":
+        return 'start_survey'
+    elif data == "consent_continue":
+        return 'consent_continue'
+    elif data == "reserve_info":
+        return 'reserve_info'
+    elif data == "help":
+        return 'help'
+    elif data in ["yes", "no"]:
+        return 'yes_no'
+    elif data in ["yes_want_reserve", "no_want_reserve"]:
+        return 'yes_no'
+    elif data in ["yes_ready_training", "no_ready_training"]:
+        return 'yes_no'
+    elif data in ["yes_ready_rotation", "no_ready_rotation"]:
+        return 'yes_no'
+    elif data.startswith("city_"):
+        return 'city'
+    elif data == "finish_cities":
+        return 'finish_cities'
+    elif data.startswith("reason_"):
+        return 'reason'
+    elif data == "finish_reasons":
+        return 'finish_reasons'
+    elif data.startswith("education_"):
+        return 'education'
+    elif data.startswith("age_"):
+        return 'age'
+    elif data.startswith("current_city_"):
+        return 'current_city'
+    return ''
+
+
+def router_dispatch(data: str):
+    action, payload = parse_callback_data(data)
+    if action == 'answer':
+        return SURVEY.callbacks.get(payload)
+    return CALLBACK_HANDLERS.get(action)
+
+
+def sample_callbacks() -> list[str]:
+    """Все callback_data, которые отправляет бот (меню и кнопки опроса по умолчанию)"""
+    return list(MENU_CALLBACKS) + list(SURVEY.callbacks)
+
+
+def bench(func, callbacks: list[str], number: int) -> float:
+    """Среднее время одного вызова в наносекундах"""
+    elapsed = timeit.timeit(lambda: [func(data) for data in callbacks], number=number)
+    return elapsed / (number * len(callbacks)) * 1e9
+
+
+def main():
+    callbacks = sample_callbacks()
+    number = 20000
+
+    # Проверяем, что маршрутизатор распознает все кнопки, известные старой цепочке
+    for data in callbacks:
+        assert legacy_dispatch(data), data
+        assert router_dispatch(data) is not None, data
+
+    groups = {
+        'все кнопки': callbacks,
+        'current_city_*': [data for data in callbacks if data.startswith("current_city_")],
+        'age_*': [data for data in callbacks if data.startswith("age_")],
+        'main_menu': ["main_menu"]
+    }
+
+    print(f"{'набор':<16}{'if/elif, нс':>14}{'router, нс':>14}{'ускорение':>12}")
+    for name, group in groups.items():
+        legacy = bench(legacy_dispatch, group, number)
+        router = bench(router_dispatch, group, number)
+        print(f"{name:<16}{legacy:>14.1f}{router:>14.1f}{legacy / router:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Бенчмарки кода, который выполняется на каждом шаге опроса.
+
+Проверка и очистка текста, табельный номер, ФИО, формирование данных опроса,
+клавиатуры, таблица переходов, а также полные вызовы handle_button_click и
+handle_message на поддельных Update (Bot API не вызывается).
+
+Запуск из корня проекта:
+    python benchmarks/bench_hot_paths.py --save benchmarks/results/base.json
+    python benchmarks/bench_hot_paths.py --compare benchmarks/results/base.json
+"""
+import argparse
+import atexit
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Очередь отправки, логи и журнал шагов бенчмарка не должны попадать в рабочие файлы
+_workdir = tempfile.mkdtemp(prefix='survey_bench_')
+atexit.register(shutil.rmtree, _workdir, True)
+os.environ['LOG_DIR'] = _workdir
+os.environ['OUTBOX_PATH'] = os.path.join(_workdir, 'outbox.sqlite3')
+os.environ['SESSIONS_PATH'] = os.path.join(_workdir, 'sessions.sqlite3')
+os.environ['SURVEY_EVENTS_PATH'] = ''
+os.environ['SURVEY_VERSIONS_DIR'] = os.path.join(_workdir, 'survey_versions')
+
+from telegram import User
+
+import bot
+from outbox import OutboxWorker
+
+# Фраза для ответов разной длины
+PHRASE = "Хочу развиваться в управлении производством, логистикой и качеством продукции. "
+TEXT_LENGTHS = (10, 50, 200, 1000)
+SUSPICIOUS_TEXT = "Начальник цеха -- SELECT из <script>alert(1)</script>; admin \\x41 " * 3
+
+
+def cyrillic_text(length: int) -> str:
+    return (PHRASE * (length // len(PHRASE) + 1))[:length]
+
+
+# Полный проход опроса по ветке «хочу в резерв» и короткий - по ветке «не хочу»
+SURVEY_YES = [
+    ('callback', 'start_survey'), ('callback', 'consent_continue'), ('callback', 'yes'),
+    ('callback', 'yes_want_reserve'), ('text', 'Начальник смены'), ('callback', 'yes_ready_training'),
+    ('text', 'Не хватает опыта руководства коллективом'), ('text', 'Больше обучения и наставничества'),
+    ('callback', 'yes_ready_rotation'), ('callback', 'city_Минск'), ('callback', 'city_Брест'),
+    ('callback', 'city_Гродно'), ('callback', 'city_Брест'), ('callback', 'finish_cities'),
+    ('text', 'Производство'), ('callback', 'current_city_Орша'), ('text', 'Мастер участка'),
+    ('callback', 'education_Обучаюсь'), ('text', 'Белорусский государственный технологический университет'),
+    ('callback', 'age_26-30'), ('text', '12 345'), ('text', 'Иванов Иван Иванович')
+]
+SURVEY_NO = [
+    ('callback', 'start_survey'), ('callback', 'consent_continue'), ('callback', 'yes'),
+    ('callback', 'no_want_reserve'), ('callback', 'reason_0'), ('callback', 'reason_2'),
+    ('callback', 'finish_reasons'), ('text', 'Нет времени'), ('text', 'Гибкий график'),
+    ('callback', 'current_city_Пинск'), ('text', 'Оператор линии'), ('callback', 'education_Высшее'),
+    ('callback', 'age_Больше 40'), ('text', '777'), ('text', 'Петрова Анна Сергеевна')
+]
+
+SAMPLE_ANSWERS = {
+    'isAgree': "✅ Да", 'isEmployee': "✅ Да", 'wantReserve': "✅ Да",
+    'desiredPosition': "Начальник смены", 'readyTraining': "❌ Нет",
+    'careerObstacles': cyrillic_text(200), 'improvementSuggestions': cyrillic_text(50),
+    'readyRotation': "✅ Да", 'preferredCities': "Минск, Брест, Гродно", 'structuralUnit': "Производство",
+    'currentCity': "Орша", 'currentPosition': "Мастер участка", 'education': "Обучаюсь",
+    'educationInstitution': "БГТУ", 'age': "26-30", 'tabNumber': "12345", 'fio': "Иванов Иван Иванович"
+}
+
+
+# Поддельные объекты Telegram: методы ничего не отправляют
+class FakeMessage:
+    def __init__(self, user: User, text: str = "", message_id: int = 1):
+        self.from_user = user
+        self.text = text
+        self.chat_id = user.id
+        self.message_id = message_id
+
+    async def reply_text(self, text, **kwargs):
+        return FakeMessage(self.from_user, text, self.message_id + 1)
+
+
+class FakeCallbackQuery:
+    def __init__(self, user: User, data: str):
+        self.from_user = user
+        self.data = data
+        self.message = FakeMessage(user)
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        return self.message
+
+
+def fake_update(user: User, kind: str, data: str):
+    if kind == 'callback':
+        query = FakeCallbackQuery(user, data)
+        return SimpleNamespace(callback_query=query, message=None, effective_user=user, effective_message=query.message)
+    message = FakeMessage(user, data)
+    return SimpleNamespace(callback_query=None, message=message, effective_user=user, effective_message=message)
+
+
+def bench(func, number: int, repeat: int = 5) -> float:
+    """Лучшее из repeat среднее время вызова в наносекундах"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def micro_benchmarks(number: int) -> dict[str, float]:
+    results = {}
+    for length in TEXT_LENGTHS:
+        text = cyrillic_text(length)
+        results[f"validate_and_sanitize_text[{length}]"] = bench(lambda: bot.validate_and_sanitize_text(text), number)
+        results[f"sanitize_text[{length}]"] = bench(lambda: bot.sanitize_text(text), number)
+    results["sanitize_text[suspicious]"] = bench(lambda: bot.sanitize_text(SUSPICIOUS_TEXT), number)
+
+    results["validate_tab_number"] = bench(lambda: bot.validate_tab_number("12 345"), number)
+    results["validate_fio"] = bench(lambda: bot.validate_fio("Иванов Иван Иванович"), number)
+    results["clean_answer_text"] = bench(lambda: bot.clean_answer_text("✅ Да"), number)
+
+    respondent = bot.Respondent(123456789, "Иван", "Иванов", "ivanov", "ru")
+    results["format_survey_data"] = bench(lambda: bot.format_survey_data(respondent, SAMPLE_ANSWERS), number // 10)
+
+    survey = bot.surveys.default
+    cities = survey.questions['preferredCities']
+    reasons = survey.questions['reasonsNotJoining']
+    selected_cities = ["Минск", "Брест", "Гродно"]
+    selected_reasons = [reasons.options[0], reasons.options[2]]
+    results["get_main_menu_keyboard"] = bench(bot.get_main_menu_keyboard, number)
+    results["markup[yes_no]"] = bench(survey.questions['wantReserve'].markup, number)
+    results["markup[cities:3]"] = bench(lambda: cities.markup(selected_cities), number)
+    results["markup[reasons:2]"] = bench(lambda: reasons.markup(selected_reasons), number)
+    results["render_selection[cities:3]"] = bench(lambda: bot.render_selection(cities, selected_cities), number)
+
+    context = SimpleNamespace(user_data={'branch': 'no', 'survey': survey.as_tuple()})
+    transitions = [('isEmployee', 'yes'), ('wantReserve', 'no'), ('improvementSuggestions', '*'),
+                   ('education', 'Высшее'), ('reasonsNotJoining', 'other')]
+    results["get_next_question"] = bench(
+        lambda: [bot.get_next_question(question, context, answer) for question, answer in transitions], number
+    ) / len(transitions)
+    return results
+
+
+async def handler_benchmarks(surveys: int) -> dict[str, float]:
+    """Время вызова обработчиков на полном проходе опроса"""
+    bot.survey_outbox.open()
+    bot.outbox_worker = OutboxWorker(bot.survey_outbox, bot.send_survey_data)
+    timings = {'handle_button_click': [], 'handle_message': [], 'survey': []}
+    try:
+        for index in range(surveys):
+            user = User(id=500000 + index, first_name="Иван", is_bot=False, last_name="Иванов", language_code="ru")
+            context = SimpleNamespace(user_data={})
+            script = SURVEY_YES if index % 2 == 0 else SURVEY_NO
+            survey_started = time.perf_counter()
+            for kind, data in script:
+                update = fake_update(user, kind, data)
+                started = time.perf_counter()
+                if kind == 'callback':
+                    await bot.handle_button_click(update, context)
+                    timings['handle_button_click'].append(time.perf_counter() - started)
+                else:
+                    await bot.handle_message(update, context)
+                    timings['handle_message'].append(time.perf_counter() - started)
+            timings['survey'].append(time.perf_counter() - survey_started)
+            assert not context.user_data, "опрос не завершился"
+    finally:
+        bot.survey_outbox.close()
+    return {name: sum(values) / len(values) * 1e9 for name, values in timings.items()}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: dict[str, float], baseline_path: str, threshold: float) -> bool:
+    """Печатает сравнение с сохраненными результатами; True, если есть регрессии"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} ({baseline['meta'].get('revision') or '?'}, {baseline['meta'].get('date')})")
+    print(f"{'бенчмарк':<40}{'было, нс':>14}{'стало, нс':>14}{'отношение':>12}")
+    regressions = False
+    for name, value in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<40}{'-':>14}{value:>14.0f}")
+            continue
+        ratio = value / before
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  регрессия"
+            regressions = True
+        print(f"{name:<40}{before:>14.0f}{value:>14.0f}{ratio:>11.2f}x{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help="вызовов в одном замере микробенчмарков")
+    parser.add_argument('--surveys', type=int, default=200, help="полных проходов опроса через обработчики")
+    parser.add_argument('--save', help="сохранить результаты в JSON")
+    parser.add_argument('--compare', help="сравнить с сохраненными результатами")
+    parser.add_argument('--threshold', type=float, default=0.10, help="допустимое замедление (доля)")
+    args = parser.parse_args()
+
+    # Логи обработчиков пишутся как обычно, но не в консоль
+    bot.console_handler.setLevel(logging.WARNING)
+
+    results = micro_benchmarks(args.number)
+    results.update({f"e2e.{name}": value for name, value in asyncio.run(handler_benchmarks(args.surveys)).items()})
+
+    print(f"{'бенчмарк':<40}{'нс/вызов':>14}")
+    for name, value in results.items():
+        print(f"{name:<40}{value:>14.0f}")
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        meta = {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'number': args.number,
+            'surveys': args.surveys
+        }
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.save}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
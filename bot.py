@@ -1,41 +1,157 @@
 import asyncio
 import os
 import re
-import urllib3
 import json
-import requests
+import time
+import httpx
+import atexit
+import queue
 import logging
-from datetime import datetime
+import logging.handlers
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import lru_cache, wraps
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from outbox import SurveyOutbox, OutboxWorker
+from update_processor import PerUserUpdateProcessor
+from session_store import SQLiteSessionPersistence
+from rate_limiter import FairRateLimiter
+from webhook import run_webhook
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from sanitizer import sanitize_text, has_meaningful_text
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from http_server import start_http_server, text_response
+from tracing import SampledProfiler, span, span_observers, trace, traced
+from surveys import BUTTON_TYPES, YES_NO_ANSWERS, Question, Survey, SurveyRegistry
+from broadcast import BroadcastStore, Broadcaster, read_chat_ids
+from survey_stats import SurveyStats
 
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 API_USERNAME = os.getenv('API_USERNAME')
 API_PASSWORD = os.getenv('API_PASSWORD')
 
+# Адрес бэкенда опросов
+API_BASE_URL = os.getenv('API_BASE_URL', "https://edi1.savushkin.com:5050")
+SURVEYS_PATH = "/bot/xr/surveys/add"
+# Эндпоинт пакетной отправки опросов (пусто - только поштучная отправка)
+API_BULK_SURVEYS_PATH = os.getenv('API_BULK_SURVEYS_PATH', '')
+
+# Время жизни токена авторизации и запас для упреждающего обновления (секунды)
+API_TOKEN_TTL = int(os.getenv('API_TOKEN_TTL', '3600'))
+API_TOKEN_REFRESH_MARGIN = int(os.getenv('API_TOKEN_REFRESH_MARGIN', '300'))
+
+# Защита от медленного бэкенда: не больше API_MAX_CONCURRENT_REQUESTS запросов одновременно,
+# после API_BREAKER_FAILURES ошибок подряд запросы не отправляются API_BREAKER_RESET секунд
+API_MAX_CONCURRENT_REQUESTS = int(os.getenv('API_MAX_CONCURRENT_REQUESTS', '4'))
+API_BREAKER_FAILURES = int(os.getenv('API_BREAKER_FAILURES', '5'))
+API_BREAKER_RESET = float(os.getenv('API_BREAKER_RESET', '30'))
+
+# Локальная очередь отправки опросов
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join('data', 'outbox.sqlite3'))
+# Пакетная отправка: не больше OUTBOX_BATCH_SIZE опросов в запросе,
+# новые опросы копятся до OUTBOX_BATCH_WINDOW секунд
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_BATCH_WINDOW = float(os.getenv('OUTBOX_BATCH_WINDOW', '2'))
+
+# Максимум одновременно обрабатываемых обновлений (1 - последовательная обработка)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))
+
+# Хранение незавершенных опросов: файл, время жизни неактивной сессии и период сброса на диск (секунды)
+SESSIONS_PATH = os.getenv('SESSIONS_PATH', os.path.join('data', 'sessions.sqlite3'))
+SESSION_TTL = int(os.getenv('SESSION_TTL', str(24 * 3600)))
+SESSION_FLUSH_INTERVAL = int(os.getenv('SESSION_FLUSH_INTERVAL', '10'))
+
+# Каталог описаний опросов (JSON/YAML) и период проверки изменений файлов (секунды)
+SURVEYS_DIR = os.getenv('SURVEYS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'surveys'))
+SURVEY_RELOAD_INTERVAL = float(os.getenv('SURVEY_RELOAD_INTERVAL', '5'))
+# Опрос кнопки «Начать опрос» (если такого нет - первый по имени файла)
+DEFAULT_SURVEY = os.getenv('DEFAULT_SURVEY', 'talent_reserve')
+# Архив загруженных версий опросов: по нему начатые сессии доходят до конца и после перезапуска
+SURVEY_VERSIONS_DIR = os.getenv('SURVEY_VERSIONS_DIR', os.path.join('data', 'survey_versions'))
+
+# Режим переписки: verbose - ответ дублируется отдельным сообщением (по умолчанию),
+# compact - ответ и следующий вопрос выводятся одним сообщением за один запрос к Bot API
+SURVEY_TRANSCRIPT_MODE = os.getenv('SURVEY_TRANSCRIPT_MODE', 'verbose')
+COMPACT_TRANSCRIPT = SURVEY_TRANSCRIPT_MODE == 'compact'
+
+# Окно объединения быстрых нажатий в списках множественного выбора (секунды, 0 - без задержки)
+MULTI_SELECT_DEBOUNCE = float(os.getenv('MULTI_SELECT_DEBOUNCE', '0.7'))
+
+# Лимиты запросов к Bot API: всего в секунду, в секунду на чат, допустимая серия в чат
+BOT_API_RATE = float(os.getenv('BOT_API_RATE', '30'))
+BOT_API_CHAT_RATE = float(os.getenv('BOT_API_CHAT_RATE', '1'))
+BOT_API_CHAT_BURST = float(os.getenv('BOT_API_CHAT_BURST', '3'))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Публичный адрес вебхука для регистрации в Telegram (пусто - не регистрировать)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+
+# HTTP-эндпоинт метрик в формате Prometheus (/metrics); порт 0 - не запускать
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
+# Администраторы бота (Telegram id через запятую): им доступна команда /broadcast
+ADMIN_IDS = frozenset(int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if admin_id)
+
+# Вопросы (questionId), по ответам на которые ведется статистика /stats
+STATS_QUESTIONS = [
+    question_id.strip()
+    for question_id in os.getenv(
+        'STATS_QUESTIONS', 'wantReserve,readyTraining,readyRotation,preferredCities,currentCity,age,education'
+    ).split(',')
+    if question_id.strip()
+]
+
+# Рассылка приветствия: хранилище кампаний (кому уже отправлено), файл получателей по умолчанию
+# (chat id в первом поле строки), темп (сообщений в секунду - ниже BOT_API_RATE, чтобы остался
+# запас для ответов пользователям), число одновременных отправок и попыток на чат
+BROADCAST_PATH = os.getenv('BROADCAST_PATH', os.path.join('data', 'broadcast.sqlite3'))
+BROADCAST_RECIPIENTS_PATH = os.getenv('BROADCAST_RECIPIENTS_PATH', os.path.join('data', 'broadcast_recipients.txt'))
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '20'))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', '3'))
+
+# Адрес Bot API (для локальной проверки можно указать тестовый сервер, например tools/fake_bot_api.py)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', '')
+
 # Настройка логирования - УБИРАЕМ ЛИШНИЕ ЛОГИ
 logging.getLogger('httpx').setLevel(logging.WARNING)
 logging.getLogger('httpcore').setLevel(logging.WARNING)
 logging.getLogger('telegram').setLevel(logging.WARNING)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
 
-# Настройка нашего логгера
-logger = logging.getLogger(__name__)
+# Настройка нашего логгера (модули бота пишут в дочерние логгеры survey_bot.*)
+logger = logging.getLogger('survey_bot')
 logger.setLevel(logging.INFO)
 
 # Создаем форматтер
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 
-# Создаем папку logs если ее нет
-logs_dir = 'logs'
+# Папка логов (журнал бота, журнал шагов, профили); создаем, если ее нет
+logs_dir = os.getenv('LOG_DIR', 'logs')
 os.makedirs(logs_dir, exist_ok=True)
 
-# Файловый обработчик
-log_filename = f'survey_bot_{datetime.now().strftime("%Y%m%d")}.log'
-log_filepath = os.path.join(logs_dir, log_filename)
-file_handler = logging.FileHandler(log_filepath, encoding='utf-8')
+# Сколько архивных дневных логов хранить (0 - все)
+LOG_BACKUP_DAYS = int(os.getenv('LOG_BACKUP_DAYS', '0'))
+
+# Файловый обработчик: текущий день пишется в survey_bot.log,
+# в полночь файл переименовывается в survey_bot.ГГГГММДД.log
+log_filepath = os.path.join(logs_dir, 'survey_bot.log')
+file_handler = logging.handlers.TimedRotatingFileHandler(
+    log_filepath, when='midnight', backupCount=LOG_BACKUP_DAYS, encoding='utf-8'
+)
+file_handler.suffix = '%Y%m%d'
+file_handler.extMatch = re.compile(r'(?<!\d)\d{8}(?!\d)', re.ASCII)
+file_handler.namer = lambda name: name.replace('survey_bot.log.', 'survey_bot.') + '.log'
 file_handler.setLevel(logging.INFO)
 file_handler.setFormatter(formatter)
 
@@ -44,12 +160,147 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(formatter)
 
-# Добавляем обработчики только к нашему логгеру
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
-
-# Отключаем предупреждения о небезопасном HTTPS
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# Обработчики пишут в фоновом потоке: логгер только кладет запись в очередь,
+# и обработчики обновлений не ждут диска и консоли
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+# Трассировка: обработка дольше TRACE_SLOW_MS пишется в лог с разбивкой по участкам (0 - не писать)
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '1000'))
+# Профилирование каждого N-го обновления под cProfile (0 - выключено; меняется на лету
+# через /debug/profile?every=N на порту метрик); профили пишутся в PROFILE_DIR
+PROFILE_EVERY = int(os.getenv('PROFILE_EVERY', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(logs_dir, 'profiles'))
+
+# Журнал шагов опроса (JSONL, по событию на каждое обновление; пусто - не вести)
+SURVEY_EVENTS_PATH = os.getenv('SURVEY_EVENTS_PATH', os.path.join(logs_dir, 'survey_events.jsonl'))
+
+# Отдельный логгер без вывода в консоль: в файл пишется только JSON события
+event_log = logging.getLogger('survey_events')
+event_log.setLevel(logging.INFO)
+event_log.propagate = False
+event_listener = None
+if SURVEY_EVENTS_PATH:
+    os.makedirs(os.path.dirname(SURVEY_EVENTS_PATH) or '.', exist_ok=True)
+    events_handler = logging.handlers.TimedRotatingFileHandler(
+        SURVEY_EVENTS_PATH, when='midnight', backupCount=LOG_BACKUP_DAYS, encoding='utf-8'
+    )
+    events_handler.setFormatter(logging.Formatter('%(message)s'))
+    event_queue = queue.SimpleQueue()
+    event_listener = logging.handlers.QueueListener(event_queue, events_handler)
+    event_listener.start()
+    atexit.register(event_listener.stop)
+    event_log.addHandler(logging.handlers.QueueHandler(event_queue))
+
+# Метрики (отдаются на METRICS_PORT, обновление - изменение словаря в памяти)
+metrics = MetricsRegistry('survey_bot_')
+UPDATES_TOTAL = metrics.counter('updates_total', "Обработанные обновления по обработчикам", ('handler',))
+HANDLER_SECONDS = metrics.histogram('handler_seconds', "Время обработки обновления", ('handler',))
+SURVEYS_STARTED = metrics.counter('surveys_started_total', "Начатые опросы", ('survey',))
+SURVEYS_BRANCHED = metrics.counter('surveys_branch_total', "Ответы на вопрос ветвления опроса по веткам", ('survey', 'branch'))
+SURVEYS_COMPLETED = metrics.counter('surveys_completed_total', "Завершенные опросы по веткам (none - досрочный выход)", ('survey', 'branch'))
+BACKEND_SECONDS = metrics.histogram('backend_request_seconds', "Время отправки на бэкенд", ('operation',))
+BACKEND_REQUESTS = metrics.counter('backend_requests_total', "Отправки на бэкенд по результату", ('operation', 'outcome'))
+SPAN_SECONDS = metrics.histogram('span_seconds', "Время участков обработки обновлений (обработчики, Bot API, бэкенд)", ('span',))
+BROADCAST_MESSAGES = metrics.counter('broadcast_messages_total', "Попытки отправки рассылки по результату", ('outcome',))
+TOKEN_REFRESHES = metrics.counter('token_refreshes_total', "Обновления токена авторизации", ('outcome',))
+ACTIVE_SESSIONS = metrics.gauge('active_sessions', "Пользователи с данными в user_data")
+SURVEYS_IN_PROGRESS = metrics.gauge('surveys_in_progress', "Незавершенные опросы")
+OUTBOX_PENDING = metrics.gauge('outbox_pending', "Опросы в очереди отправки")
+metrics.gauge('survey_definitions', "Загруженные опросы по версиям", ('survey', 'version'),
+              function=lambda: {(survey.id, survey.version): 1 for survey in surveys.active()})
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+metrics.gauge('backend_breaker_state', "Размыкатель бэкенда: 0 - закрыт, 1 - пробный запрос, 2 - открыт",
+              function=lambda: BREAKER_STATES[backend_breaker.state])
+metrics.gauge('backend_in_flight', "Выполняющиеся запросы к бэкенду", function=lambda: backend_breaker.in_flight)
+metrics.gauge('backend_waiting', "Запросы к бэкенду в очереди на выполнение", function=lambda: backend_breaker.waiting)
+metrics.gauge('bot_api_limiter', "Статистика ограничения запросов к Bot API (накопительная)", ('stat',),
+              function=lambda: {(key,): value for key, value in bot_rate_limiter.stats.items()})
+span_observers.append(lambda name, seconds: SPAN_SECONDS.observe(seconds, name))
+
+update_profiler = SampledProfiler(PROFILE_EVERY, PROFILE_DIR)
+
+# Ответы, записанные при обработке текущего обновления (для журнала шагов)
+step_answers: ContextVar[list | None] = ContextVar('step_answers', default=None)
+
+def note_answer(question_key: str, answer: str):
+    """Отмечает ответ, полученный в текущем обновлении"""
+    answers = step_answers.get()
+    if answers is not None:
+        answers.append((question_key, answer))
+
+def log_step(handler):
+    """Учитывает обновление в метриках, трассирует и при необходимости профилирует
+    его обработку и пишет в журнал шагов событие: кто, на какой вопрос, что прислал
+    и сколько длилась обработка (в том числе по участкам).
+    
+    Поле input/data позволяет воспроизвести поток (см. tools/load_test.py).
+    """
+    name = handler.__name__
+    
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        UPDATES_TOTAL.inc(name)
+        question = context.user_data.get('current_question') or None
+        answers = []
+        token = step_answers.set(answers)
+        profile = update_profiler.start()
+        try:
+            with trace(name) as update_trace:
+                return await handler(update, context)
+        finally:
+            update_profiler.stop(profile, f"{name}_{update.update_id}")
+            step_answers.reset(token)
+            latency = update_trace.duration
+            HANDLER_SECONDS.observe(latency, name)
+            if TRACE_SLOW_MS and latency * 1000 >= TRACE_SLOW_MS:
+                logger.warning(f"Медленная обработка обновления {update.update_id}: {update_trace.summary()}")
+            if event_log.handlers:
+                if update.callback_query:
+                    kind, data = 'callback', update.callback_query.data
+                else:
+                    kind, data = 'text', update.effective_message.text if update.effective_message else None
+                if answers:
+                    question, answer = answers[-1]
+                else:
+                    answer = None
+                event_log.info(json.dumps({
+                    'ts': round(time.time(), 3),
+                    'user': update.effective_user.id if update.effective_user else None,
+                    'question': question,
+                    'answer': answer,
+                    'input': kind,
+                    'data': data,
+                    'latency_ms': round(latency * 1000, 2),
+                    'spans': update_trace.totals_ms()
+                }, ensure_ascii=False, separators=(',', ':')))
+    
+    return wrapper
+
+# Общий HTTP-клиент для бэкенда (создается в post_init, закрывается в post_shutdown)
+http_client: httpx.AsyncClient | None = None
+
+# Очередь опросов и воркер ее доставки на бэкенд
+survey_outbox = SurveyOutbox(OUTBOX_PATH)
+outbox_worker: OutboxWorker | None = None
+
+# Хранилище сессий опроса и задача вытеснения неактивных сессий
+session_persistence = SQLiteSessionPersistence(SESSIONS_PATH, SESSION_TTL, SESSION_FLUSH_INTERVAL)
+session_eviction_task: asyncio.Task | None = None
+
+# HTTP-сервер метрик (запускается в post_init)
+metrics_server: asyncio.AbstractServer | None = None
+
+# Ограничение исходящих запросов к Bot API (счетчики - в bot_rate_limiter.stats)
+bot_rate_limiter = FairRateLimiter(BOT_API_RATE, BOT_API_CHAT_RATE, BOT_API_CHAT_BURST)
+
+# Кампании рассылки и их отправка (создается в post_init)
+broadcast_store = BroadcastStore(BROADCAST_PATH)
+broadcaster: Broadcaster | None = None
 
 # Приветственное сообщение
 WELCOME_MESSAGE = """Добро пожаловать в бот опроса кадрового резерва ОАО «Савушкин продукт»!
@@ -91,106 +342,65 @@ HELP_TEXT = """❓ **Помощь**
 
 Для возврата в главное меню используйте кнопку 🏠 Главное меню"""
 
-# Списки для выбора
-CITIES = ["Брест", "Береза", "Барановичи", "Пинск", "Столин", "Орша", "Иваново", 
-          "Минск", "Витебск", "Гродно", "Гомель", "Могилёв", "ТФ Полесский"]
+# Опросы загружаются из SURVEYS_DIR (формат описан в surveys.py) и перечитываются при изменении файлов.
+# Сессия закреплена за версией опроса, на которой начата: user_data['survey'] - ссылка (id, версия).
+# Сам объект Survey в user_data не кладется: PTB копирует user_data (deepcopy) перед каждым сохранением
+START_SURVEY_CALLBACK = 'start_survey'
+MENU_CALLBACKS = ('main_menu', 'reserve_info', 'help', START_SURVEY_CALLBACK)
 
-REASONS_NO_RESERVE = [
-    "Удовлетворён текущей должностью",
-    "Не готов(а) брать на себя ответственность",
-    "Не уверен(а) в своих силах", 
-    "Психологически не готов(а)",
-    "Другое (укажите)"
-]
+surveys = SurveyRegistry(SURVEYS_DIR, SURVEY_VERSIONS_DIR, DEFAULT_SURVEY, MENU_CALLBACKS)
+surveys.refresh()
+if surveys.default is None:
+    raise RuntimeError(f"В {SURVEYS_DIR} нет ни одного корректного описания опроса")
 
-EDUCATION_LEVELS = [
-    "Профессионально-техническое",
-    "Среднее специальное", 
-    "Высшее",
-    "Обучаюсь"
-]
+# Задача проверки изменений описаний опросов
+survey_reload_task: asyncio.Task | None = None
 
-AGE_GROUPS = ["18-25", "26-30", "31-35", "36-40", "Больше 40"]
-
-# Единый словарь всех вопросов в camelCase
-QUESTIONS = {
-    'isAgree': {
-        'text': "Продолжая, я соглашаюсь с политикой обработки персональных данных в соответствии с Законом Республики Беларусь \"О защите персональных данных\"",
-        'type': 'consent'
-    },
-    'isEmployee': {
-        'text': "Вы сотрудник ОАО «Савушкин продукт»?",
-        'type': 'yes_no'
-    },
-    'wantReserve': {
-        'text': "Хотели бы Вы, чтобы Ваша кандидатура была рассмотрена для включения в кадровый резерв?",
-        'type': 'yes_no_custom'
-    },
-    'desiredPosition': {
-        'text': "Какую должность Вы рассматриваете для возможного назначения в рамках кадрового резерва?",
-        'type': 'text'
-    },
-    'readyTraining': {
-        'text': "Готовы ли Вы пройти обучение или стажировку для включения в кадровый резерв?",
-        'type': 'yes_no_custom'
-    },
-    'careerObstacles': {
-        'text': "Что, по Вашему мнению, мешает карьерному росту внутри компании?",
-        'type': 'text'
-    },
-    'improvementSuggestions': {
-        'text': "Есть ли у Вас предложения по улучшению работы Вашего филиала или компании в целом?",
-        'type': 'text'
-    },
-    'readyRotation': {
-        'text': "Готовы ли Вы к ротации или переводу в другое подразделение или филиал?",
-        'type': 'yes_no_custom'
-    },
-    'preferredCities': {
-        'text': "Укажите предпочтительные города для ротации (можно выбрать несколько):",
-        'type': 'cities'
-    },
-    'structuralUnit': {
-        'text': "Укажите структурное подразделение для ротации (логистика, продажи, бухгалтерии, производство и т.п.):",
-        'type': 'text'
-    },
-    'reasonsNotJoining': {
-        'text': "Пожалуйста, укажите причину, по которой Вы не готовы рассматривать включение в кадровый резерв:",
-        'type': 'reasons'
-    },
-    'currentCity': {
-        'text': "Укажите ПП/ТФ, в котором вы работаете:",
-        'type': 'current_city'
-    },
-    'currentPosition': {
-        'text': "Укажите Вашу профессию/должность, которую Вы сейчас занимаете:",
-        'type': 'text'
-    },
-    'education': {
-        'text': "Укажите Ваше образование:",
-        'type': 'education'
-    },
-    'educationInstitution': {
-        'text': "Укажите учебное заведение, в котором обучаетесь:",
-        'type': 'text'
-    },
-    'age': {
-        'text': "Укажите Ваш возраст:",
-        'type': 'age'
-    },
-    'tabNumber': {
-        'text': "Укажите Ваш табельный номер:",
-        'type': 'tab_number'
-    },
-    'fio': {
-        'text': "Укажите свои имя и фамилию:",
-        'type': 'text'
-    },
-    'otherReason': {
-        'text': "Пожалуйста, укажите Вашу причину:",
-        'type': 'text'
+def multi_choice_questions() -> set[str]:
+    """Вопросы множественного выбора во всех загруженных опросах"""
+    return {
+        question.key
+        for survey in surveys.active()
+        for question in survey.questions.values()
+        if question.type == 'multi_choice'
     }
-}
+
+def respondent_questions() -> dict[str, str]:
+    """Поля респондента, которые заполняются ответом на вопрос: поле -> questionId"""
+    return {
+        field: question_key
+        for survey in surveys.active()
+        for field, question_key in survey.respondent_fields.items()
+        if question_key
+    }
+
+def question_title(aggregate, question_id: str) -> str:
+    """Текст вопроса для сводки: из сохраненных ответов или из опроса по умолчанию"""
+    question = surveys.default.questions.get(question_id)
+    return aggregate.question_texts.get(question_id) or (question.text if question else question_id)
+
+# Накопительная статистика завершенных опросов (восстанавливается из очереди отправки в post_init)
+survey_stats = SurveyStats(STATS_QUESTIONS, multi_choice_questions(), respondent_questions())
+
+def session_survey(user_data: dict) -> Survey:
+    """Опрос, за которым закреплена сессия; незакрепленная сессия закрепляется за опросом по умолчанию"""
+    reference = user_data.get('survey')
+    if reference:
+        # Ссылка (id, версия); из хранилища сессий восстанавливается списком
+        survey_id, version = reference
+        survey = surveys.get(survey_id, version)
+        if survey is not None:
+            return survey
+        logger.warning(f"Версия опроса {survey_id}@{version} не найдена, сессия переведена на текущую версию")
+        survey = surveys.current(survey_id) or surveys.default
+    else:
+        survey = surveys.default
+        # Сессии, сохраненные до появления описаний опросов
+        for legacy_key in ('selected_cities', 'selected_reasons'):
+            if legacy_key in user_data:
+                user_data['selected'] = user_data.pop(legacy_key)
+    user_data['survey'] = survey.as_tuple()
+    return survey
 
 def validate_text_length(text: str, max_length: int = 1000) -> tuple[bool, str]:
     """Проверка длины текста"""
@@ -198,32 +408,13 @@ def validate_text_length(text: str, max_length: int = 1000) -> tuple[bool, str]:
         return False, f"❌ Сообщение слишком длинное. Максимум {max_length} символов."
     return True, ""
 
-def sanitize_text(text: str) -> str:
-
-    dangerous_patterns = [
-        r"(\bDROP\b|\bDELETE\b|\bINSERT\b|\bUPDATE\b|\bSELECT\b|\bUNION\b)",
-        r"(\-\-|\;|\/\*|\*\/)",
-        r"(<script|<\/script>|javascript:)",
-        r"(\\x[0-9a-fA-F]{2})",
-        r"(\badmin\b|\broot\b|\btest\b)",
-        r"([<>])",
-    ]
-    
-    sanitized = text
-    for pattern in dangerous_patterns:
-        sanitized = re.sub(pattern, '[removed]', sanitized, flags=re.IGNORECASE)
-    
-    sanitized = sanitized[:1000]
-    return sanitized.strip()
-
 def validate_and_sanitize_text(text: str) -> tuple[bool, str, str]:
     """Полная валидация и очистка текста"""
     is_valid_length, length_error = validate_text_length(text)
     if not is_valid_length:
         return False, length_error, ""
     
-    clean_text = re.sub(r'[^\w\sа-яА-ЯёЁ.,!?;:()\-]', '', text)
-    if not clean_text.strip():
+    if not has_meaningful_text(text):
         return False, "❌ Текст содержит только специальные символы. Пожалуйста, введите осмысленный текст.", ""
     
     sanitized_text = sanitize_text(text)
@@ -234,110 +425,29 @@ def validate_and_sanitize_text(text: str) -> tuple[bool, str, str]:
     return True, "", sanitized_text
 
 # Inline-клавиатуры
-def get_main_menu_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("📝 Начать опрос", callback_data="start_survey")],
-        [InlineKeyboardButton("ℹ️ О кадровом резерве", callback_data="reserve_info")],
-        [InlineKeyboardButton("❓ Помощь", callback_data="help")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-def get_back_to_menu_keyboard():
-    keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]]
-    return InlineKeyboardMarkup(keyboard)
-
-def get_yes_no_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("✅ Да", callback_data="yes")],
-        [InlineKeyboardButton("❌ Нет", callback_data="no")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-def get_yes_no_custom_keyboard(question_key: str):
-    """Клавиатура для кастомных Да/Нет вопросов"""
-    if question_key == 'wantReserve':
-        callback_yes = "yes_want_reserve"
-        callback_no = "no_want_reserve"
-    elif question_key == 'readyTraining':
-        callback_yes = "yes_ready_training"
-        callback_no = "no_ready_training"
-    elif question_key == 'readyRotation':
-        callback_yes = "yes_ready_rotation"
-        callback_no = "no_ready_rotation"
-    else:
-        callback_yes = "yes"
-        callback_no = "no"
-    
+# Клавиатуры вопросов собираются при загрузке описания опроса (Question.markup)
+def build_main_menu_keyboard() -> InlineKeyboardMarkup:
+    """Главное меню: по кнопке на каждый опрос, опрос по умолчанию - первым"""
+    default = surveys.default
     keyboard = [
-        [InlineKeyboardButton("✅ Да", callback_data=callback_yes)],
-        [InlineKeyboardButton("❌ Нет", callback_data=callback_no)]
+        [InlineKeyboardButton(survey.button, callback_data=START_SURVEY_CALLBACK if survey is default
+                              else f"{START_SURVEY_CALLBACK}_{survey.id}")]
+        for survey in sorted(surveys.active(), key=lambda survey: survey is not default)
     ]
+    keyboard.append([InlineKeyboardButton("ℹ️ О кадровом резерве", callback_data="reserve_info")])
+    keyboard.append([InlineKeyboardButton("❓ Помощь", callback_data="help")])
     return InlineKeyboardMarkup(keyboard)
 
-def get_cities_keyboard(selected_cities=None):
-    if selected_cities is None:
-        selected_cities = []
-    
-    keyboard = []
-    cities_per_row = 2
-    
-    for i in range(0, len(CITIES), cities_per_row):
-        row = []
-        for city in CITIES[i:i + cities_per_row]:
-            mark = "✅" if city in selected_cities else "◻️"
-            row.append(InlineKeyboardButton(f"{mark} {city}", callback_data=f"city_{city}"))
-        keyboard.append(row)
-    
-    keyboard.append([InlineKeyboardButton("✅ Завершить выбор", callback_data="finish_cities")])
-    return InlineKeyboardMarkup(keyboard)
+# Пересобирается при изменении набора опросов
+MAIN_MENU_KEYBOARD = build_main_menu_keyboard()
 
-def get_reasons_keyboard(selected_reasons=None):
-    if selected_reasons is None:
-        selected_reasons = []
-    
-    keyboard = []
-    for i, reason in enumerate(REASONS_NO_RESERVE):
-        mark = "✅" if reason in selected_reasons else "◻️"
-        callback_data = f"reason_{i}"
-        keyboard.append([InlineKeyboardButton(f"{mark} {reason}", callback_data=callback_data)])
-    keyboard.append([InlineKeyboardButton("✅ Завершить выбор", callback_data="finish_reasons")])
-    return InlineKeyboardMarkup(keyboard)
-
-def get_education_keyboard():
-    keyboard = []
-    for education in EDUCATION_LEVELS:
-        keyboard.append([InlineKeyboardButton(education, callback_data=f"education_{education}")])
-    return InlineKeyboardMarkup(keyboard)
-
-def get_age_keyboard():
-    keyboard = []
-    ages_per_row = 3
-    
-    for i in range(0, len(AGE_GROUPS), ages_per_row):
-        row = []
-        for age in AGE_GROUPS[i:i + ages_per_row]:
-            row.append(InlineKeyboardButton(age, callback_data=f"age_{age}"))
-        keyboard.append(row)
-    
-    return InlineKeyboardMarkup(keyboard)
+BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]])
 
-def get_current_city_keyboard():
-    keyboard = []
-    cities_per_row = 2
-    
-    for i in range(0, len(CITIES), cities_per_row):
-        row = []
-        for city in CITIES[i:i + cities_per_row]:
-            row.append(InlineKeyboardButton(city, callback_data=f"current_city_{city}"))
-        keyboard.append(row)
-    
-    return InlineKeyboardMarkup(keyboard)
+def get_main_menu_keyboard():
+    return MAIN_MENU_KEYBOARD
 
-def get_consent_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("✅ Продолжить", callback_data="consent_continue")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+def get_back_to_menu_keyboard():
+    return BACK_TO_MENU_KEYBOARD
 
 # Обработчики команд
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -365,45 +475,208 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for question_key, answer in answers.items():
             status_text += f"{question_key}: {answer}\n"
         
-        if 'fio' in answers:
+        if not user_data.get('current_question'):
             status_text += "\n✅ Опрос завершен!"
         else:
             status_text += "\n⏳ Опрос в процессе..."
     
     await update.message.reply_text(status_text, reply_markup=get_back_to_menu_keyboard(), parse_mode='Markdown')
 
+async def check_admin(update: Update) -> bool:
+    """Команды администраторов: остальным отвечаем отказом"""
+    user = update.effective_user
+    if user is not None and user.id in ADMIN_IDS:
+        return True
+    await update.message.reply_text("⛔ Команда доступна только администраторам.")
+    return False
+
+# Ограничение длины сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+async def reply_long_text(message, text: str):
+    """Отправляет длинный текст несколькими сообщениями, разрезая по строкам"""
+    chunk = ""
+    for line in text.split("\n"):
+        if chunk and len(chunk) + len(line) + 1 > MESSAGE_LIMIT:
+            await message.reply_text(chunk)
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line
+    if chunk:
+        await message.reply_text(chunk[:MESSAGE_LIMIT])
+
+def format_counts(counts, share: bool = True) -> str:
+    """Ответы по убыванию частоты: «Да 12 (60%), Нет 8 (40%)»; share=False - без долей"""
+    total = sum(counts.values()) or 1
+    return ", ".join(
+        f"{value or '—'} {count} ({round(count * 100 / total)}%)" if share else f"{value or '—'} {count}"
+        for value, count in counts.most_common()
+    )
+
+def format_survey_stats(question_id: str | None = None) -> str:
+    """Сводка /stats: по всем отслеживаемым вопросам или по одному вопросу в разрезе филиалов"""
+    if not survey_stats.surveys:
+        return "📊 Завершенных опросов пока нет."
+    lines = []
+    for name, aggregate in survey_stats.surveys.items():
+        lines.append(f"📊 {name}: завершено {aggregate.total}")
+        if question_id is None:
+            lines.append(f"По филиалам: {format_counts(aggregate.filials)}")
+            for key in STATS_QUESTIONS:
+                if key in aggregate.answers:
+                    lines.append(f"\n{question_title(aggregate, key)} [{key}]")
+                    lines.append(format_counts(aggregate.answers[key], key not in survey_stats.multi_questions))
+        elif question_id in aggregate.answers:
+            share = question_id not in survey_stats.multi_questions
+            lines.append(f"{question_title(aggregate, question_id)} [{question_id}]")
+            lines.append(f"Всего: {format_counts(aggregate.answers[question_id], share)}")
+            for filial, counts in sorted(aggregate.by_filial[question_id].items()):
+                lines.append(f"{filial}: {format_counts(counts, share)}")
+        else:
+            lines.append(f"Ответов на {question_id} нет")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Статистика ответов для администраторов: /stats или /stats <questionId> - по филиалам"""
+    if not await check_admin(update):
+        return
+    question_id = context.args[0] if context.args else None
+    if question_id is not None and question_id not in survey_stats.questions:
+        await update.message.reply_text(
+            f"Статистика ведется по вопросам: {', '.join(STATS_QUESTIONS)}.\nПример: /stats wantReserve"
+        )
+        return
+    await reply_long_text(update.message, format_survey_stats(question_id))
+
+BROADCAST_STATUS_NAMES = {
+    'draft': "ожидает запуска",
+    'running': "идет",
+    'paused': "приостановлена",
+    'done': "завершена",
+    'cancelled': "отменена"
+}
+
+BROADCAST_HELP = """📣 Рассылка приветствия с главным меню
+
+/broadcast file [путь] - получатели из файла (по умолчанию BROADCAST_RECIPIENTS_PATH)
+/broadcast sessions - все, кто начинал или завершал опрос
+/broadcast start - запустить или продолжить рассылку
+/broadcast pause - приостановить
+/broadcast cancel - отменить
+/broadcast status - ход рассылки"""
+
+async def format_broadcast_status(campaign: dict) -> str:
+    """Статистика доставки кампании для администратора"""
+    stats = await broadcast_store.stats(campaign['id'])
+    lines = [
+        f"📣 Рассылка №{campaign['id']} ({campaign['source']}): {BROADCAST_STATUS_NAMES.get(campaign['status'], campaign['status'])}",
+        f"Получателей: {sum(stats.values())}",
+        f"Отправлено: {stats['sent']}",
+        f"Ожидает отправки: {stats['pending']}",
+        f"Заблокировали бота: {stats['blocked']}",
+        f"Ошибки: {stats['failed']}"
+    ]
+    errors = await broadcast_store.top_errors(campaign['id'])
+    if errors:
+        lines.append("\nЧастые ошибки:")
+        lines.extend(f"{count} × {error}" for error, count in errors)
+    return "\n".join(lines)
+
+async def broadcast_recipients(source: str, args: list[str]):
+    """Получатели новой кампании: (описание источника, итерируемые chat id)"""
+    if source == 'file':
+        path = args[0] if args else BROADCAST_RECIPIENTS_PATH
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Файл {path} не найден")
+        return f"файл {os.path.basename(path)}", read_chat_ids(path)
+    # Личные чаты: chat id совпадает с id пользователя
+    user_ids = set(await session_persistence.user_ids())
+    user_ids.update(await survey_outbox.user_ids())
+    return "участники опросов", sorted(user_ids)
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка приветствия: только для администраторов из ADMIN_IDS"""
+    if not await check_admin(update):
+        return
+    user = update.effective_user
+    if broadcaster is None:
+        await update.message.reply_text("Рассылка сейчас недоступна, попробуйте позже.")
+        return
+    
+    action = context.args[0].lower() if context.args else 'status'
+    campaign = await broadcast_store.campaign(statuses=('draft', 'running', 'paused'))
+    
+    if action in ('file', 'sessions'):
+        if campaign is not None:
+            await update.message.reply_text(
+                f"Уже есть незавершенная рассылка №{campaign['id']}. Запустите ее или отмените: /broadcast cancel"
+            )
+            return
+        try:
+            source, chat_ids = await broadcast_recipients(action, context.args[1:])
+            campaign_id, count = await broadcast_store.create(source, user.id, chat_ids)
+        except OSError as e:
+            await update.message.reply_text(f"❌ Не удалось прочитать получателей: {e}")
+            return
+        logger.info(f"Администратор {user.id} создал рассылку №{campaign_id}: {source}, получателей {count}")
+        await update.message.reply_text(
+            f"📣 Рассылка №{campaign_id} подготовлена: {source}, получателей {count}.\n"
+            f"Запуск: /broadcast start, отмена: /broadcast cancel"
+        )
+    elif action == 'start':
+        if campaign is None:
+            await update.message.reply_text("Нет подготовленной рассылки. " + BROADCAST_HELP)
+        elif broadcaster.running:
+            await update.message.reply_text(f"Рассылка №{campaign['id']} уже идет: /broadcast status")
+        else:
+            await broadcast_store.set_status(campaign['id'], 'running')
+            broadcaster.start(campaign['id'])
+            logger.info(f"Администратор {user.id} запустил рассылку №{campaign['id']}")
+            await update.message.reply_text(f"▶️ Рассылка №{campaign['id']} запущена. Ход: /broadcast status")
+    elif action in ('pause', 'cancel'):
+        if campaign is None:
+            await update.message.reply_text("Нет незавершенной рассылки.")
+            return
+        if broadcaster.running:
+            await broadcaster.stop()
+        status = 'paused' if action == 'pause' else 'cancelled'
+        await broadcast_store.set_status(campaign['id'], status)
+        logger.info(f"Администратор {user.id}: рассылка №{campaign['id']} {BROADCAST_STATUS_NAMES[status]}")
+        campaign['status'] = status
+        await update.message.reply_text(await format_broadcast_status(campaign))
+    elif action == 'status':
+        campaign = campaign or await broadcast_store.campaign(statuses=('done', 'cancelled'))
+        if campaign is None:
+            await update.message.reply_text(BROADCAST_HELP)
+        else:
+            await update.message.reply_text(await format_broadcast_status(campaign))
+    else:
+        await update.message.reply_text(BROADCAST_HELP)
+
 # Универсальная функция для задавания вопросов
-async def ask_question(update, context: ContextTypes.DEFAULT_TYPE, question_key: str):
-    """Универсальная функция для задавания вопроса"""
-    question_data = QUESTIONS[question_key]
-    question_text = question_data['text']
-    question_type = question_data['type']
-    
-    # Определяем клавиатуру в зависимости от типа вопроса
-    if question_type == 'consent':
-        keyboard = get_consent_keyboard()
-    elif question_type == 'yes_no':
-        keyboard = get_yes_no_keyboard()
-    elif question_type == 'yes_no_custom':
-        keyboard = get_yes_no_custom_keyboard(question_key)
-    elif question_type == 'cities':
-        context.user_data['selected_cities'] = []
-        keyboard = get_cities_keyboard()
-    elif question_type == 'reasons':
-        context.user_data['selected_reasons'] = []
-        context.user_data['other_reason'] = None
-        keyboard = get_reasons_keyboard()
-    elif question_type == 'current_city':
-        keyboard = get_current_city_keyboard()
-    elif question_type == 'education':
-        keyboard = get_education_keyboard()
-    elif question_type == 'age':
-        keyboard = get_age_keyboard()
+@traced()
+async def ask_question(update, context: ContextTypes.DEFAULT_TYPE, question_key: str,
+                       prefix: str = "", edit: bool = False):
+    """Универсальная функция для задавания вопроса.
+    
+    prefix выводится перед текстом вопроса, а при edit=True вопрос заменяет
+    сообщение с нажатой кнопкой (update - это CallbackQuery) вместо отправки нового.
+    """
+    question = session_survey(context.user_data).questions[question_key]
+    question_text = prefix + question.text
+    
+    if question.type == 'multi_choice':
+        context.user_data['selected'] = []
+        # Перерисовка выбора сохраняет начало сообщения (в компактном режиме - предыдущий вопрос и ответ)
+        context.user_data['question_prefix'] = prefix
     else:
-        keyboard = None
+        context.user_data.pop('question_prefix', None)
+    keyboard = question.markup()
     
     # Отправляем вопрос
-    if hasattr(update, 'message') and update.message:
+    if edit:
+        await update.edit_message_text(question_text, reply_markup=keyboard)
+    elif hasattr(update, 'message') and update.message:
         if keyboard:
             await update.message.reply_text(question_text, reply_markup=keyboard)
         else:
@@ -416,305 +689,285 @@ async def ask_question(update, context: ContextTypes.DEFAULT_TYPE, question_key:
     
     context.user_data['current_question'] = question_key
 
-def get_next_question(current_question: str, context: ContextTypes.DEFAULT_TYPE) -> str:
-    """Определяет следующий вопрос на основе текущего и ветки опроса"""
-    user_data = context.user_data
-    branch = user_data.get('branch')
-    
-    question_flow = {
-        'desiredPosition': 'readyTraining',
-        'readyTraining': 'careerObstacles',
-        'careerObstacles': 'improvementSuggestions',
-        'improvementSuggestions': 'readyRotation',
-        'structuralUnit': 'currentCity',
-        'currentCity': 'currentPosition',
-        'currentPosition': 'education',
-        'educationInstitution': 'age',
-        'age': 'tabNumber',
-        'tabNumber': 'fio',
-        'fio': None
-    }
+def get_next_question(current_question: str, context: ContextTypes.DEFAULT_TYPE, answer: str = '*') -> str | None:
+    """Определяет следующий вопрос по таблице переходов с учетом ответа и ветки опроса"""
+    survey = session_survey(context.user_data)
+    return survey.next_question(current_question, context.user_data.get('branch'), answer)
+
+async def advance(update, context: ContextTypes.DEFAULT_TYPE, question_key: str, answer: str = '*',
+                  prefix: str = "", edit: bool = False):
+    """Переходит к следующему вопросу после ответа (или завершает опрос).
     
-    # Ветка "Нет" (не хочу в кадровый резерв)
-    if branch == 'no':
-        if current_question == 'reasonsNotJoining':
-            return 'careerObstacles'
-        elif current_question == 'otherReason':
-            return 'careerObstacles'
-        elif current_question == 'careerObstacles':
-            return 'improvementSuggestions'
-        elif current_question == 'improvementSuggestions':
-            return 'currentCity'
-    
-    # Особые случаи для образования
-    if current_question == 'education':
-        answers = user_data.get('answers', {})
-        if answers.get('education') == "Обучаюсь":
-            return 'educationInstitution'
+    prefix и edit передаются в ask_question (компактный режим переписки).
+    """
+    survey = session_survey(context.user_data)
+    if question_key == survey.branch_question:
+        context.user_data['branch'] = answer
+        SURVEYS_BRANCHED.inc(survey.id, answer)
+    
+    exit_message = survey.exits.get((question_key, answer))
+    next_question = None if exit_message else get_next_question(question_key, context, answer)
+    if next_question:
+        await ask_question(update, context, next_question, prefix, edit)
+        return
+    
+    # Опрос закончился - выводим накопленный ответ отдельно
+    if prefix:
+        if edit:
+            await update.edit_message_text(prefix.rstrip())
         else:
-            return 'age'
+            await update.message.reply_text(prefix.rstrip())
     
-    return question_flow.get(current_question)
+    if exit_message:
+        await update.message.reply_text(exit_message)
+        await finish_survey(update, context, show_completion_message=False)
+    else:
+        await finish_survey(update, context)
 
-# Главный обработчик inline-кнопок
-async def handle_button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
+# Маршрутизация inline-кнопок
+@lru_cache(maxsize=1024)
+def parse_callback_data(data: str) -> tuple[str, str]:
+    """Разбирает callback_data на (действие, параметр); кнопки вопросов опроса - действие answer"""
+    if data in CALLBACK_HANDLERS:
+        return data, ''
+    if data.startswith(f"{START_SURVEY_CALLBACK}_"):
+        return START_SURVEY_CALLBACK, data[len(START_SURVEY_CALLBACK) + 1:]
+    return 'answer', data
+
+async def record_answer(query, context: ContextTypes.DEFAULT_TYPE, question_key: str, answer: str,
+                        echo: str | None = None, transition: str = '*'):
+    """Сохраняет ответ кнопкой, убирает клавиатуру, дублирует ответ сообщением и переходит дальше"""
+    context.user_data['answers'][question_key] = answer
+    note_answer(question_key, answer)
+    logger.info(f"Пользователь {query.from_user.id}: {question_key} = {clean_answer_text(answer)}")
+    
+    question_text = session_survey(context.user_data).questions[question_key].text
+    
+    # Компактный режим: вопрос, ответ и следующий вопрос - одним редактированием сообщения
+    if COMPACT_TRANSCRIPT:
+        prefix = f"{question_text}\n{echo or answer}\n\n"
+        await advance(query, context, question_key, transition, prefix, edit=True)
+        return
     
-    user_data = context.user_data
+    # Оставляем текст вопроса без кнопок и отправляем ответ пользователя новым сообщением
+    await query.edit_message_text(question_text)
+    await query.message.reply_text(echo or answer)
     
-    if 'answers' not in user_data:
-        user_data['answers'] = {}
+    await advance(query, context, question_key, transition)
 
-    # Навигация
-    if query.data == "main_menu":
-        await query.edit_message_text("🏠 Главное меню:", reply_markup=get_main_menu_keyboard())
-    
-    elif query.data == "start_survey":
-        user_data.clear()
-        user_data['answers'] = {}
-        
-        # Сохраняем правильного пользователя
-        user_data['telegram_user'] = query.from_user  # СОХРАНЯЕМ ПОЛЬЗОВАТЕЛЯ
-        
-        user_id = query.from_user.id
-        logger.info(f"Пользователь {user_id} начал опрос")
-        
-        # Редактируем сообщение с главным меню, убирая кнопки
-        await query.edit_message_text(WELCOME_MESSAGE, parse_mode='Markdown')
-        
-        # Переходим к вопросу о согласии
-        await ask_question(query, context, 'isAgree')
+# Навигация
+async def on_main_menu(query, context: ContextTypes.DEFAULT_TYPE, payload: str):
+    await query.edit_message_text("🏠 Главное меню:", reply_markup=get_main_menu_keyboard())
 
-    elif query.data == "consent_continue":
-        # Сохраняем ответ о согласии
-        user_data['answers']['isAgree'] = "✅ Да"
+async def on_reserve_info(query, context: ContextTypes.DEFAULT_TYPE, payload: str):
+    await query.edit_message_text(RESERVE_INFO, reply_markup=get_back_to_menu_keyboard(), parse_mode='Markdown')
 
-        # Логируем ответ
-        logger.info(f"Пользователь {query.from_user.id}: isAgree = Да")
-        
-        # Оставляем текст согласия без кнопки (редактируем)
-        await query.edit_message_text(QUESTIONS['isAgree']['text'])
-        
-        # Отправляем ответ пользователя новым сообщением
-        await query.message.reply_text("✅ Да")
-        
-        # Переходим к первому вопросу
-        await ask_question(query, context, 'isEmployee')
+async def on_help(query, context: ContextTypes.DEFAULT_TYPE, payload: str):
+    await query.edit_message_text(HELP_TEXT, reply_markup=get_back_to_menu_keyboard(), parse_mode='Markdown')
 
-    elif query.data == "reserve_info":
-        await query.edit_message_text(RESERVE_INFO, reply_markup=get_back_to_menu_keyboard(), parse_mode='Markdown')
+async def on_start_survey(query, context: ContextTypes.DEFAULT_TYPE, payload: str):
+    survey = surveys.current(payload) if payload else surveys.default
+    if survey is None:
+        # Кнопка из старого меню, опрос уже снят
+        await query.edit_message_text("Этот опрос больше не проводится.\n\n🏠 Главное меню:", reply_markup=get_main_menu_keyboard())
+        return
     
-    elif query.data == "help":
-        await query.edit_message_text(HELP_TEXT, reply_markup=get_back_to_menu_keyboard(), parse_mode='Markdown')
+    user_data = context.user_data
+    user_data.clear()
+    user_data['survey'] = survey.as_tuple()
+    user_data['answers'] = {}
     
-    # Вопрос 1: Сотрудник компании
-    elif query.data in ["yes", "no"]:
-        user_data['answers']['isEmployee'] = "✅ Да" if query.data == "yes" else "❌ Нет"
-        await query.edit_message_text(QUESTIONS['isEmployee']['text'])
-        await query.message.reply_text("✅ Да" if query.data == "yes" else "❌ Нет")
-        
-        # Логируем ответ
-        answer_text = "Да" if query.data == "yes" else "Нет"
-        logger.info(f"Пользователь {query.from_user.id}: isEmployee = {answer_text}")
-        
-        if query.data == "yes":
-            await ask_question(query, context, 'wantReserve')
-        else:
-            user_data['answers']['isEmployee'] = "❌ Нет"
-            await query.message.reply_text("Данный опрос только для сотрудников компании. Спасибо за внимание!")
-            await finish_survey(query, context, show_completion_message=False)
-    
-    # Вопрос 2: Кадровый резерв
-    elif query.data in ["yes_want_reserve", "no_want_reserve"]:
-        user_data['answers']['wantReserve'] = "✅ Да" if query.data == "yes_want_reserve" else "❌ Нет"
-        await query.edit_message_text(QUESTIONS['wantReserve']['text'])
-        await query.message.reply_text("✅ Да" if query.data == "yes_want_reserve" else "❌ Нет")
-        
-        # Логируем ответ
-        answer_text = "Да" if query.data == "yes_want_reserve" else "Нет"
-        logger.info(f"Пользователь {query.from_user.id}: wantReserve = {answer_text}")
-        
-        if query.data == "yes_want_reserve":
-            user_data['branch'] = 'yes'
-            await ask_question(query, context, 'desiredPosition')
-        else:
-            user_data['branch'] = 'no'
-            await ask_question(query, context, 'reasonsNotJoining')
-    
-    # Вопрос 5: Обучение
-    elif query.data in ["yes_ready_training", "no_ready_training"]:
-        user_data['answers']['readyTraining'] = "✅ Да" if query.data == "yes_ready_training" else "❌ Нет"
-        await query.edit_message_text(QUESTIONS['readyTraining']['text'])
-        await query.message.reply_text("✅ Да" if query.data == "yes_ready_training" else "❌ Нет")
-        
-        # Логируем ответ
-        answer_text = "Да" if query.data == "yes_ready_training" else "Нет"
-        logger.info(f"Пользователь {query.from_user.id}: readyTraining = {answer_text}")
-        
-        await ask_question(query, context, 'careerObstacles')
+    # Сохраняем правильного пользователя
+    user_data['telegram_user'] = Respondent.from_user(query.from_user)  # СОХРАНЯЕМ ПОЛЬЗОВАТЕЛЯ
     
-    # Вопрос 8: Ротация
-    elif query.data in ["yes_ready_rotation", "no_ready_rotation"]:
-        user_data['answers']['readyRotation'] = "✅ Да" if query.data == "yes_ready_rotation" else "❌ Нет"
-        await query.edit_message_text(QUESTIONS['readyRotation']['text'])
-        await query.message.reply_text("✅ Да" if query.data == "yes_ready_rotation" else "❌ Нет")
-        
-        # Логируем ответ
-        answer_text = "Да" if query.data == "yes_ready_rotation" else "Нет"
-        logger.info(f"Пользователь {query.from_user.id}: readyRotation = {answer_text}")
-        
-        if query.data == "yes_ready_rotation":
-            await ask_question(query, context, 'preferredCities')
-        else:
-            await ask_question(query, context, 'currentCity')
+    logger.info(f"Пользователь {query.from_user.id} начал опрос {survey.id} (версия {survey.version})")
+    SURVEYS_STARTED.inc(survey.id)
     
-    # Выбор городов для ротации
-    elif query.data.startswith("city_"):
-        city = query.data[5:]
-        selected_cities = user_data.get('selected_cities', [])
-        
-        if city in selected_cities:
-            selected_cities.remove(city)
-        else:
-            selected_cities.append(city)
-        
-        user_data['selected_cities'] = selected_cities
-        
-        # Логируем выбор города
-        logger.info(f"Пользователь {query.from_user.id}: выбрал город {city}, текущий выбор: {selected_cities}")
-        
-        await query.edit_message_text(
-            QUESTIONS['preferredCities']['text'] + "\n\nВыбрано: " + ", ".join(selected_cities) if selected_cities else "Ничего не выбрано",
-            reply_markup=get_cities_keyboard(selected_cities)
-        )
+    # Редактируем сообщение с главным меню, убирая кнопки
+    await query.edit_message_text(survey.welcome or WELCOME_MESSAGE, parse_mode='Markdown')
+    
+    # Переходим к первому вопросу
+    await ask_question(query, context, survey.first_question)
 
-    elif query.data == "finish_cities":
-        selected_cities = user_data.get('selected_cities', [])
-        if selected_cities:
-            user_data['answers']['preferredCities'] = ", ".join(selected_cities)
-            await query.edit_message_text(QUESTIONS['preferredCities']['text'])
-            cities_text = "\n".join([f"✅ {city}" for city in selected_cities])
-            await query.message.reply_text(cities_text)
-            
-            # Логируем финальный выбор городов
-            logger.info(f"Пользователь {query.from_user.id}: preferredCities = {selected_cities}")
-            
-            await ask_question(query, context, 'structuralUnit')
-        else:
-            await query.answer("❌ Пожалуйста, выберите хотя бы один город.", show_alert=True)
+# Ответы кнопками
+async def on_answer(query, context: ContextTypes.DEFAULT_TYPE, payload: str):
+    survey = session_survey(context.user_data)
+    button = survey.callbacks.get(payload)
+    if button is None:
+        # Кнопка из сообщения другого опроса или другой его версии
+        logger.info(f"Пользователь {query.from_user.id}: кнопка {payload!r} не относится к опросу {survey.id}@{survey.version}")
+        return
     
-    # Выбор причин отказа
-    elif query.data.startswith("reason_"):
-        try:
-            reason_index = int(query.data[7:])
-            reason_text = REASONS_NO_RESERVE[reason_index]
-            selected_reasons = user_data.get('selected_reasons', [])
-            
-            if reason_text in selected_reasons:
-                selected_reasons.remove(reason_text)
-                if reason_text == "Другое (укажите)":
-                    user_data.pop('other_reason', None)
-            else:
-                selected_reasons.append(reason_text)
-            
-            user_data['selected_reasons'] = selected_reasons
-            
-            # Логируем выбор причины
-            logger.info(f"Пользователь {query.from_user.id}: выбрал причину '{reason_text}', текущий выбор: {selected_reasons}")
-            
-            await query.edit_message_text(
-                QUESTIONS['reasonsNotJoining']['text'] + "\n\nВыбрано: " + ", ".join(selected_reasons) if selected_reasons else "Ничего не выбрано",
-                reply_markup=get_reasons_keyboard(selected_reasons)
-            )
-        except (ValueError, IndexError):
-            await query.answer("❌ Ошибка обработки", show_alert=True)
-
-    elif query.data == "finish_reasons":
-        selected_reasons = user_data.get('selected_reasons', [])
-        if selected_reasons:
-            user_data['answers']['reasonsNotJoining'] = ", ".join(selected_reasons)
-            await query.edit_message_text(QUESTIONS['reasonsNotJoining']['text'])
-            
-            reasons_text = "\n".join([f"✅ {reason}" for reason in selected_reasons])
-            
-            if user_data.get('other_reason'):
-                reasons_text += f"\n✅ Другое: {user_data['other_reason']}"
-                user_data['answers']['reasonsNotJoining'] += f" ({user_data['other_reason']})"
-            
-            await query.message.reply_text(reasons_text)
-            
-            # Логируем финальный выбор причин
-            logger.info(f"Пользователь {query.from_user.id}: reasonsNotJoining = {selected_reasons}")
-            if user_data.get('other_reason'):
-                logger.info(f"Пользователь {query.from_user.id}: другая причина = {user_data['other_reason']}")
-            
-            if "Другое (укажите)" in selected_reasons and not user_data.get('other_reason'):
-                await ask_question(query, context, 'otherReason')
-            else:
-                await ask_question(query, context, 'careerObstacles')
-        else:
-            await query.answer("❌ Пожалуйста, выберите хотя бы одну причину.", show_alert=True)
-    
-    # Образование
-    elif query.data.startswith("education_"):
-        education = query.data[10:]
-        user_data['answers']['education'] = education
-        await query.edit_message_text(QUESTIONS['education']['text'])
-        await query.message.reply_text(f"✅ {education}")
-        
-        # Логируем ответ
-        logger.info(f"Пользователь {query.from_user.id}: education = {education}")
-        
-        if education == "Обучаюсь":
-            await ask_question(query, context, 'educationInstitution')
-        else:
-            await ask_question(query, context, 'age')
-    
-    # Возраст
-    elif query.data.startswith("age_"):
-        age = query.data[4:]
-        user_data['answers']['age'] = age
-        await query.edit_message_text(QUESTIONS['age']['text'])
-        await query.message.reply_text(f"✅ {age}")
-        
-        # Логируем ответ
-        logger.info(f"Пользователь {query.from_user.id}: age = {age}")
-        
-        await ask_question(query, context, 'tabNumber')
-    
-    # Текущий город
-    elif query.data.startswith("current_city_"):
-        city = query.data[13:]
-        user_data['answers']['currentCity'] = city
-        await query.edit_message_text(QUESTIONS['currentCity']['text'])
-        await query.message.reply_text(f"✅ {city}")
-        
-        # Логируем ответ
-        logger.info(f"Пользователь {query.from_user.id}: currentCity = {city}")
+    question_key, action, value = button
+    question = survey.questions[question_key]
+    if action in ('toggle', 'finish') and question_key != context.user_data.get('current_question'):
+        # Кнопка списка уже закрытого вопроса: общий список 'selected' относится только к текущему
+        logger.info(f"Пользователь {query.from_user.id}: кнопка {payload!r} вопроса {question_key}, "
+                    f"текущий вопрос {context.user_data.get('current_question')} - пропущена")
+        return
+    if action == 'toggle':
+        await toggle_option(query, context, question, value)
+    elif action == 'finish':
+        await finish_selection(query, context, question)
+    elif question.type == 'yes_no':
+        await record_answer(query, context, question_key, YES_NO_ANSWERS[value], transition=value)
+    elif question.type == 'consent':
+        await record_answer(query, context, question_key, YES_NO_ANSWERS['yes'])
+    else:
+        await record_answer(query, context, question_key, value, f"✅ {value}", transition=value)
+
+# Перерисовка клавиатур множественного выбора
+class DebouncedEditor:
+    """Объединяет быстрые нажатия в одну перерисовку сообщения.
+    
+    Выбор сохраняется сразу, а сообщение редактируется через delay секунд
+    после последнего нажатия - в Bot API уходит только последнее состояние.
+    """
+    
+    # Сколько последних показанных состояний помнить (брошенные списки выбора вытесняются)
+    MAX_SHOWN = 10000
+    
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._tasks: dict[tuple[int, int], asyncio.Task] = {}
+        # (чат, сообщение) -> показанный текст, в порядке последнего редактирования
+        self._shown: OrderedDict[tuple[int, int], str] = OrderedDict()
+    
+    @staticmethod
+    def _key(query) -> tuple[int, int]:
+        return query.message.chat_id, query.message.message_id
+    
+    async def schedule(self, query, render):
+        """render() -> (текст, клавиатура) вызывается в момент отправки"""
+        if self.delay <= 0:
+            text, keyboard = render()
+            await query.edit_message_text(text, reply_markup=keyboard)
+            return
         
-        await ask_question(query, context, 'currentPosition')
+        key = self._key(query)
+        task = self._tasks.get(key)
+        if task is not None:
+            task.cancel()
+        self._tasks[key] = asyncio.create_task(self._edit_later(key, query, render))
+    
+    def cancel(self, query):
+        """Отменяет отложенную перерисовку (вопрос уже закрыт)"""
+        key = self._key(query)
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        self._shown.pop(key, None)
+    
+    async def _edit_later(self, key: tuple[int, int], query, render):
+        try:
+            await asyncio.sleep(self.delay)
+            text, keyboard = render()
+            # Состояние вернулось к уже показанному - редактировать нечего
+            if self._shown.get(key) == text:
+                return
+            await query.edit_message_text(text, reply_markup=keyboard)
+            self._shown[key] = text
+            self._shown.move_to_end(key)
+            if len(self._shown) > self.MAX_SHOWN:
+                self._shown.popitem(last=False)
+        except asyncio.CancelledError:
+            pass
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning(f"Не удалось обновить клавиатуру выбора: {e}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить клавиатуру выбора: {e}")
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+multi_select_editor = DebouncedEditor(MULTI_SELECT_DEBOUNCE)
+
+def render_selection(question: Question, selected: list, prefix: str = "") -> tuple[str, InlineKeyboardMarkup]:
+    text = question.text + "\n\nВыбрано: " + ", ".join(selected) if selected else "Ничего не выбрано"
+    return prefix + text, question.markup(selected)
+
+# Множественный выбор: вариант отмечается сразу, сообщение перерисовывается с задержкой
+async def toggle_option(query, context: ContextTypes.DEFAULT_TYPE, question: Question, option: str):
+    user_data = context.user_data
+    selected = user_data.get('selected', [])
+    
+    if option in selected:
+        selected.remove(option)
+    else:
+        selected.append(option)
+    
+    user_data['selected'] = selected
+    
+    # Логируем выбор
+    logger.info(f"Пользователь {query.from_user.id}: {question.key} - выбрал '{option}', текущий выбор: {selected}")
+    
+    prefix = user_data.get('question_prefix', "")
+    await multi_select_editor.schedule(query, lambda: render_selection(question, selected, prefix))
+
+async def finish_selection(query, context: ContextTypes.DEFAULT_TYPE, question: Question):
+    selected = context.user_data.get('selected', [])
+    if not selected:
+        await query.answer(question.empty_alert, show_alert=True)
+        return
+    
+    multi_select_editor.cancel(query)
+    echo = "\n".join([f"✅ {option}" for option in selected])
+    transition = 'other' if question.other_option in selected else '*'
+    await record_answer(query, context, question.key, ", ".join(selected), echo, transition)
+
+# Действие -> обработчик
+CALLBACK_HANDLERS = {
+    'main_menu': on_main_menu,
+    'reserve_info': on_reserve_info,
+    'help': on_help,
+    START_SURVEY_CALLBACK: on_start_survey,
+    'answer': on_answer
+}
+
+# Главный обработчик inline-кнопок
+async def handle_button_click(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    
+    if 'answers' not in context.user_data:
+        context.user_data['answers'] = {}
+    
+    action, payload = parse_callback_data(query.data)
+    handler = CALLBACK_HANDLERS.get(action)
+    if handler:
+        with span(handler.__name__):
+            await handler(query, context, payload)
 
 # Обработчик текстовых сообщений
+async def echo_and_advance(update: Update, context: ContextTypes.DEFAULT_TYPE, question_key: str, echo: str):
+    """Подтверждает текстовый ответ и задает следующий вопрос (в компактном режиме - одним сообщением)"""
+    if COMPACT_TRANSCRIPT:
+        await advance(update, context, question_key, prefix=f"{echo}\n\n")
+    else:
+        await update.message.reply_text(echo)
+        await advance(update, context, question_key)
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Сохраняем пользователя если еще не сохранен
     if 'telegram_user' not in context.user_data:
-        context.user_data['telegram_user'] = update.message.from_user
+        context.user_data['telegram_user'] = Respondent.from_user(update.message.from_user)
     user_message = update.message.text
     current_question = context.user_data.get('current_question', 0)
     user_id = update.message.from_user.id
     
     if 'answers' not in context.user_data:
         context.user_data['answers'] = {}
+    
+    question = session_survey(context.user_data).questions.get(current_question)
+    question_type = question.type if question else 'text'
 
-    blocked_questions = ['isEmployee', 'wantReserve', 'readyTraining', 'readyRotation', 
-                        'preferredCities', 'reasonsNotJoining', 'education', 'age', 'currentCity']
-    if current_question in blocked_questions:
+    if question_type in BUTTON_TYPES:
         await update.message.reply_text("❌ Пожалуйста, используйте кнопки для ответа на этот вопрос.")
         return
 
     # ОСОБАЯ ОБРАБОТКА ДЛЯ ТАБЕЛЬНОГО НОМЕРА
-    if current_question == 'tabNumber':
+    if question_type == 'tab_number':
         is_valid, error_msg = validate_tab_number(user_message)
         if not is_valid:
             await update.message.reply_text(error_msg)
@@ -722,38 +975,31 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Сохраняем очищенный номер
         context.user_data['answers'][current_question] = error_msg  # error_msg содержит очищенный номер
-        await update.message.reply_text(f"✅ {error_msg}")
+        note_answer(current_question, error_msg)
         
         # Логируем ответ
         logger.info(f"Пользователь {user_id}: {current_question} = {error_msg}")
         
-        # Переходим к следующему вопросу
-        next_question = get_next_question(current_question, context)
-        if next_question:
-            await ask_question(update, context, next_question)
-        else:
-            await finish_survey(update, context)
+        # Подтверждаем ответ и переходим к следующему вопросу
+        await echo_and_advance(update, context, current_question, f"✅ {error_msg}")
         return
 
     # Обычная обработка для других текстовых вопросов
-    is_valid, error_msg, sanitized_text = validate_and_sanitize_text(user_message)
+    with span('validate_and_sanitize_text'):
+        is_valid, error_msg, sanitized_text = validate_and_sanitize_text(user_message)
     if not is_valid:
         await update.message.reply_text(error_msg)
         return
 
     # Сохраняем ответ
     context.user_data['answers'][current_question] = sanitized_text
-    await update.message.reply_text(f"✅ {sanitized_text}")
+    note_answer(current_question, sanitized_text)
     
     # Логируем текстовый ответ
     logger.info(f"Пользователь {user_id}: {current_question} = {sanitized_text}")
     
-    # Определяем следующий вопрос
-    next_question = get_next_question(current_question, context)
-    if next_question:
-        await ask_question(update, context, next_question)
-    else:
-        await finish_survey(update, context)
+    # Подтверждаем ответ и переходим к следующему вопросу
+    await echo_and_advance(update, context, current_question, f"✅ {sanitized_text}")
 
 def validate_tab_number(tab_number: str) -> tuple[bool, str]:
     """Проверка табельного номера"""
@@ -774,6 +1020,9 @@ def validate_tab_number(tab_number: str) -> tuple[bool, str]:
     
     return True, clean_number
 
+# ФИО после нормализации пробелов: слова из букв, дефисов и точек через один пробел
+FIO_PATTERN = re.compile(r'[a-zA-Zа-яА-ЯёЁ\-. ]+')
+
 # Функция для валидации ФИО
 def validate_fio(fio):
     fio = sanitize_text(fio)
@@ -786,26 +1035,26 @@ def validate_fio(fio):
     if len(parts) < 2:
         return False, "Укажите как минимум имя и фамилию"
     
-    for part in parts:
-        if not re.match(r'^[a-zA-Zа-яА-ЯёЁ\-.]+$', part):
-            return False, "ФИО может содержать только буквы, дефисы и точки"
+    if not FIO_PATTERN.fullmatch(fio):
+        return False, "ФИО может содержать только буквы, дефисы и точки"
     
     return True, fio
 
 # Завершение опроса
+@traced()
 async def finish_survey(update: Update, context: ContextTypes.DEFAULT_TYPE, show_completion_message: bool = True):
     user_data = context.user_data
     
     # Берем пользователя из сохраненных данных
-    user = user_data.get('telegram_user')
+    user = Respondent.coerce(user_data.get('telegram_user'))
     if not user:
         # Если по какой-то причине нет сохраненного пользователя, пробуем получить из update
         if update.message:
-            user = update.message.from_user
+            user = Respondent.from_user(update.message.from_user)
             message = update.message
         else:
             query = update.callback_query
-            user = query.from_user
+            user = Respondent.from_user(query.from_user)
             message = query.message
     else:
         # Определяем message для отправки ответа
@@ -815,14 +1064,25 @@ async def finish_survey(update: Update, context: ContextTypes.DEFAULT_TYPE, show
             message = update.callback_query.message
     
     answers = user_data.get('answers', {})
+    survey = session_survey(user_data)
+    SURVEYS_COMPLETED.inc(survey.id, user_data.get('branch') or 'none')
     
-    survey_data = format_survey_data(user, answers)
+    survey_data = format_survey_data(user, answers, survey)
+    survey_stats.add(survey_data)
     
-    # Логируем полные результаты в файл
-    logger.info(f"Результаты опроса пользователя {user.id}:")
-    logger.info(json.dumps(survey_data, ensure_ascii=False, indent=2))
+    # Логируем полные результаты в файл одной строкой
+    logger.info(f"Результаты опроса пользователя {user.id}: {json.dumps(survey_data, ensure_ascii=False, separators=(',', ':'))}")
     
-    success = await send_survey_data(survey_data)
+    # Сначала сохраняем опрос локально - доставкой на бэкенд займется фоновый воркер
+    try:
+        with span('outbox.put'):
+            await survey_outbox.put(survey_data, user.id)
+        outbox_worker.notify()
+        success = True
+    except Exception as e:
+        logger.error(f"Не удалось сохранить опрос в очередь отправки: {e}")
+        with span('backend.send'):
+            success = await send_survey_data(survey_data)
     
     if show_completion_message:
         if success:
@@ -834,7 +1094,46 @@ async def finish_survey(update: Update, context: ContextTypes.DEFAULT_TYPE, show
     
     context.user_data.clear()
 
-def format_survey_data(user, answers: dict) -> dict:
+class Respondent:
+    """Компактный снимок данных пользователя Telegram, нужных для отправки опроса"""
+    __slots__ = ('id', 'first_name', 'last_name', 'username', 'language_code', 'is_bot', 'is_premium')
+    
+    def __init__(self, id, first_name="", last_name="", username="", language_code="", is_bot=False, is_premium=False):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.username = username
+        self.language_code = language_code
+        self.is_bot = is_bot
+        self.is_premium = is_premium
+    
+    @classmethod
+    def from_user(cls, user) -> 'Respondent':
+        return cls(
+            user.id,
+            user.first_name or "",
+            user.last_name or "",
+            user.username or "",
+            user.language_code or "",
+            bool(user.is_bot),
+            bool(getattr(user, 'is_premium', False))
+        )
+    
+    @classmethod
+    def coerce(cls, value) -> 'Respondent | None':
+        """Восстанавливает снимок из хранилища сессий (там он лежит как список полей)"""
+        if value is None or isinstance(value, cls):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(*value)
+        return cls.from_user(value)
+    
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+def format_survey_data(user, answers: dict, survey: Survey | None = None) -> dict:
+    """Данные опроса для бэкенда (по умолчанию - по текущей версии опроса по умолчанию)"""
+    survey = survey or surveys.default
     telegram_user = {
         "id": user.id,
         "firstName": user.first_name or "",
@@ -846,59 +1145,23 @@ def format_survey_data(user, answers: dict) -> dict:
     }
     
     respondent_data = {
-        "fullName": clean_answer_text(answers.get('fio', '')),
-        "ageGroup": clean_answer_text(answers.get('age', '')),
-        "position": clean_answer_text(answers.get('currentPosition', '')),
-        "filial": clean_answer_text(answers.get('currentCity', '')),
-        "isEmployee": clean_answer_text(answers.get('isEmployee', '')),
-        "isAgree": clean_answer_text(answers.get('isAgree', '')),
-        "phoneNumber": "",
-        "tabNumber": answers.get('tabNumber', ''),  # ДОБАВЛЕНО: табельный номер
-        "telegramUser": telegram_user
+        field: clean_answer_text(answers.get(question_key, '')) if question_key else ""
+        for field, question_key in survey.respondent_fields.items()
     }
+    respondent_data["telegramUser"] = telegram_user
     
-    # Исключаем isAgree и tabNumber из блока response
-    excluded_keys = ['fio', 'age', 'currentPosition', 'currentCity', 'education', 
-                    'educationInstitution', 'isEmployee', 'isAgree', 'tabNumber']
-    
-    answers_array = []
-    
-    for answer_key, answer_value in answers.items():
-        if answer_key in QUESTIONS and answer_key not in excluded_keys:
-            clean_answer = clean_answer_text(str(answer_value))
-            
-            answers_array.append({
-                "questionId": answer_key,
-                "questionText": QUESTIONS[answer_key]['text'],
-                "answerText": clean_answer
-            })
-    
-    if 'education' in answers:
-        answers_array.append({
-            "questionId": "education",
-            "questionText": QUESTIONS['education']['text'],
-            "answerText": clean_answer_text(answers['education'])
-        })
-    
-    if 'educationInstitution' in answers:
-        answers_array.append({
-            "questionId": "educationInstitution", 
-            "questionText": QUESTIONS['educationInstitution']['text'],
-            "answerText": clean_answer_text(answers['educationInstitution'])
-        })
-    
-    question_order = [
-        'wantReserve', 'desiredPosition', 'readyTraining',
-        'careerObstacles', 'improvementSuggestions', 'readyRotation',
-        'preferredCities', 'structuralUnit', 'reasonsNotJoining', 'education', 'educationInstitution'
+    sorted_answers = [
+        {
+            "questionId": question_key,
+            "questionText": survey.questions[question_key].text,
+            "answerText": clean_answer_text(str(answers[question_key]))
+        }
+        for question_key in survey.response_questions
+        if question_key in answers
     ]
     
-    sorted_answers = sorted(answers_array, 
-                          key=lambda x: question_order.index(x['questionId']) 
-                          if x['questionId'] in question_order else len(question_order))
-    
     return {
-        "name": "Хочу расти!",
+        "name": survey.name,
         "respondent": respondent_data,
         "response": {
             "answers": sorted_answers
@@ -910,21 +1173,38 @@ def clean_answer_text(answer: str) -> str:
     return cleaned
 
 # API функции
+def create_http_client() -> httpx.AsyncClient:
+    """Создает асинхронный HTTP-клиент с пулом keep-alive соединений к бэкенду"""
+    return httpx.AsyncClient(
+        base_url=API_BASE_URL,
+        verify=False,
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0),
+        headers={'Content-Type': 'application/json'}
+    )
+
+# Ошибки сети, таймауты и ответы 5xx считаются отказом бэкенда
+backend_breaker = CircuitBreaker(
+    "Бэкенд опросов",
+    failure_threshold=API_BREAKER_FAILURES,
+    reset_timeout=API_BREAKER_RESET,
+    max_concurrent=API_MAX_CONCURRENT_REQUESTS,
+    is_failure=lambda response: response.status_code >= 500
+)
+
+async def backend_post(path: str, **kwargs) -> httpx.Response:
+    """POST на бэкенд через размыкатель и ограничение одновременных запросов"""
+    return await backend_breaker.call(http_client.post, path, **kwargs)
+
 async def get_bearer_token() -> str:
     """Получает bearer token для авторизации"""
-    auth_url = "https://edi1.savushkin.com:5050/api/authentication/authenticate"
     auth_data = {
         "username": API_USERNAME,
         "password": API_PASSWORD
     }
     
     try:
-        response = requests.post(
-            auth_url, 
-            json=auth_data, 
-            verify=False,
-            timeout=10
-        )
+        response = await backend_post("/api/authentication/authenticate", json=auth_data)
         
         if response.status_code == 200:
             result = response.json()
@@ -942,35 +1222,122 @@ async def get_bearer_token() -> str:
             print(f"❌ Ошибка авторизации: {response.status_code}")
             return ""
             
+    except CircuitOpenError as e:
+        logger.warning(f"Токен не запрошен: {e}")
+        return ""
     except Exception as e:
         logger.error(f"Ошибка при получении токена: {e}")
         print(f"❌ Ошибка при получении токена: {e}")
         return ""
 
-async def send_survey_data(survey_data: dict) -> bool:
-    """Отправляет данные опроса на сервер"""
-    bearer_token = await get_bearer_token()
-    
+class TokenCache:
+    """Кэш bearer-токена с упреждающим фоновым обновлением.
+    
+    Одновременные запросы ждут одно общее обновление, а не обращаются
+    к эндпоинту авторизации каждый сам по себе.
+    """
+    
+    def __init__(self, fetch_token, ttl: float, refresh_margin: float):
+        self._fetch_token = fetch_token
+        self._ttl = ttl
+        self._refresh_margin = min(refresh_margin, ttl / 2)
+        self._token = ""
+        self._expires_at = 0.0
+        self._refresh_task: asyncio.Task | None = None
+    
+    async def get(self) -> str:
+        """Возвращает действующий токен, при необходимости обновляя его"""
+        now = time.monotonic()
+        if self._token and now < self._expires_at:
+            # Токен скоро истечет - обновляем в фоне, пока отдаем текущий
+            if now >= self._expires_at - self._refresh_margin:
+                self._start_refresh()
+            return self._token
+        return await asyncio.shield(self._start_refresh())
+    
+    def invalidate(self, token: str):
+        """Сбрасывает токен, отклоненный сервером (если его еще не заменили)"""
+        if token and token == self._token:
+            self._token = ""
+            self._expires_at = 0.0
+    
+    async def close(self):
+        """Отменяет незавершенное обновление токена"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+        self._refresh_task = None
+    
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+    
+    async def _refresh(self) -> str:
+        token = await self._fetch_token()
+        TOKEN_REFRESHES.inc('success' if token else 'failure')
+        if token:
+            self._token = token
+            self._expires_at = time.monotonic() + self._ttl
+        return token
+
+token_cache = TokenCache(get_bearer_token, API_TOKEN_TTL, API_TOKEN_REFRESH_MARGIN)
+
+async def post_with_token(path: str, payload) -> httpx.Response | None:
+    """POST на бэкенд с bearer-токеном; при 401 токен обновляется и запрос повторяется один раз.
+    
+    Возвращает None, если токен получить не удалось.
+    """
+    bearer_token = await token_cache.get()
     if not bearer_token:
         logger.error("Не удалось получить токен авторизации")
         print("❌ Не удалось получить токен авторизации")
-        return False
-    
-    survey_url = "https://edi1.savushkin.com:5050/bot/xr/surveys/add"
-    
+        return None
+    
+    response = await backend_post(path, json=payload, headers={'Authorization': f'Bearer {bearer_token}'})
+    
+    # Токен истек на сервере раньше срока - обновляем один раз и повторяем
+    if response.status_code == 401:
+        logger.info("Токен авторизации отклонен (401), получаем новый")
+        token_cache.invalidate(bearer_token)
+        bearer_token = await token_cache.get()
+        if not bearer_token:
+            logger.error("Не удалось получить токен авторизации")
+            print("❌ Не удалось получить токен авторизации")
+            return None
+        response = await backend_post(path, json=payload, headers={'Authorization': f'Bearer {bearer_token}'})
+    
+    return response
+
+def observe_backend(operation: str):
+    """Учитывает время и результат отправки на бэкенд в метриках"""
+    def decorator(send):
+        @wraps(send)
+        async def wrapper(*args):
+            started = time.perf_counter()
+            result = await send(*args)
+            BACKEND_SECONDS.observe(time.perf_counter() - started, operation)
+            if result is None:
+                outcome = 'unsupported'
+            elif isinstance(result, list):
+                outcome = 'success' if all(result) else 'partial' if any(result) else 'failure'
+            else:
+                outcome = 'success' if result else 'failure'
+            BACKEND_REQUESTS.inc(operation, outcome)
+            return result
+        return wrapper
+    return decorator
+
+@observe_backend('send')
+async def send_survey_data(survey_data: dict) -> bool:
+    """Отправляет данные опроса на сервер"""
     try:
-        headers = {
-            'Authorization': f'Bearer {bearer_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(
-            survey_url, 
-            json=survey_data, 
-            headers=headers,
-            verify=False,
-            timeout=10
-        )
+        response = await post_with_token(SURVEYS_PATH, survey_data)
+        if response is None:
+            return False
         
         if response.status_code == 200:
             result = response.json()
@@ -990,21 +1357,256 @@ async def send_survey_data(survey_data: dict) -> bool:
             print(f"❌ Ошибка отправки данных: {response.status_code}")
             return False
             
+    except CircuitOpenError as e:
+        logger.warning(f"Отправка отложена: {e}")
+        return False
     except Exception as e:
         logger.error(f"Ошибка при отправке данных: {e}")
         print(f"❌ Ошибка при отправке данных: {e}")
         return False
 
+# Бэкенд ответил, что пакетная отправка не поддерживается - больше не пробуем до перезапуска
+bulk_upload_supported = True
+
+@observe_backend('batch')
+async def send_survey_batch(surveys: list[dict]) -> list[bool] | None:
+    """Отправляет несколько опросов одним запросом на API_BULK_SURVEYS_PATH.
+    
+    Запрос: {"surveys": [...]}; ответ: {"results": [{"success": true, "id": ...}, ...]}
+    в том же порядке (без results весь пакет считается принятым).
+    Возвращает успех по каждому опросу или None, если пакетная отправка недоступна.
+    """
+    global bulk_upload_supported
+    if not API_BULK_SURVEYS_PATH or not bulk_upload_supported:
+        return None
+    
+    try:
+        response = await post_with_token(API_BULK_SURVEYS_PATH, {"surveys": surveys})
+        if response is None:
+            return [False] * len(surveys)
+        
+        if response.status_code in (404, 405, 501):
+            bulk_upload_supported = False
+            logger.warning(f"Бэкенд не поддерживает пакетную отправку ({response.status_code}), переходим на поштучную")
+            return None
+        
+        if response.status_code != 200:
+            logger.error(f"Ошибка пакетной отправки: {response.status_code} - {response.text}")
+            return [False] * len(surveys)
+        
+        results = response.json().get('results')
+        if not isinstance(results, list) or len(results) != len(surveys):
+            statuses = [True] * len(surveys)
+        else:
+            statuses = [bool(result.get('success', True)) if isinstance(result, dict) else bool(result) for result in results]
+        
+        logger.info(f"Пакетная отправка: принято {sum(statuses)} из {len(surveys)}")
+        return statuses
+    
+    except CircuitOpenError as e:
+        logger.warning(f"Пакетная отправка отложена: {e}")
+        return [False] * len(surveys)
+    except Exception as e:
+        logger.error(f"Ошибка при пакетной отправке данных: {e}")
+        return [False] * len(surveys)
+
 # Обработчик ошибок
 async def error(update: Update, context: ContextTypes.DEFAULT_TYPE):
     error_msg = f"Произошла ошибка: {context.error}"
     logger.error(error_msg)
     print(error_msg)
 
+# Жизненный цикл приложения
+async def evict_idle_sessions(application: Application):
+    """Периодически удаляет из памяти и хранилища сессии без активности дольше SESSION_TTL"""
+    interval = max(60, min(SESSION_TTL, 600))
+    while True:
+        await asyncio.sleep(interval)
+        idle_users = session_persistence.idle_users()
+        for user_id in idle_users:
+            application.drop_user_data(user_id)
+        if idle_users:
+            logger.info(f"Удалено неактивных сессий: {len(idle_users)}")
+
+async def reload_surveys():
+    """Периодически перечитывает изменившиеся описания опросов и обновляет главное меню"""
+    global MAIN_MENU_KEYBOARD
+    while True:
+        await asyncio.sleep(SURVEY_RELOAD_INTERVAL)
+        # Чтение и компиляция файлов - вне событийного цикла; обработчики при этом видят
+        # прежний или уже обновленный набор опросов (словари реестра меняются целыми операциями)
+        try:
+            changed = await asyncio.to_thread(surveys.refresh)
+        except Exception as e:
+            logger.error(f"Ошибка перечитывания описаний опросов: {e}")
+            continue
+        if changed:
+            MAIN_MENU_KEYBOARD = build_main_menu_keyboard()
+            survey_stats.multi_questions = frozenset(multi_choice_questions())
+            survey_stats.respondent_questions = respondent_questions()
+
+def make_metrics_handler(application: Application):
+    """HTTP-обработчик /metrics; значения, которые дорого обновлять на лету, считаются при запросе"""
+    async def handle(request):
+        if request.path == '/debug/profile':
+            # Включение/выключение профилирования без перезапуска: /debug/profile?every=N
+            if 'every' in request.query:
+                try:
+                    update_profiler.every = max(0, int(request.query['every']))
+                except ValueError:
+                    return text_response("every должно быть целым числом", 400)
+                logger.info(f"Профилирование: каждое {update_profiler.every}-е обновление (0 - выключено)")
+            return text_response(f"every={update_profiler.every} dir={update_profiler.directory}\n")
+        if request.path != '/metrics':
+            return text_response("Not Found", 404)
+        
+        user_data = application.user_data
+        ACTIVE_SESSIONS.set(len(user_data))
+        SURVEYS_IN_PROGRESS.set(sum(1 for data in user_data.values() if data.get('current_question')))
+        try:
+            OUTBOX_PENDING.set(await survey_outbox.pending_count())
+        except Exception as e:
+            logger.warning(f"Не удалось получить размер очереди отправки: {e}")
+        return text_response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+    
+    return handle
+
+async def post_init(application: Application):
+    """Вызывается после инициализации приложения, до получения обновлений"""
+    global http_client, outbox_worker, session_eviction_task, metrics_server, survey_reload_task, broadcaster
+    http_client = create_http_client()
+    session_eviction_task = asyncio.create_task(evict_idle_sessions(application))
+    if SURVEY_RELOAD_INTERVAL > 0:
+        survey_reload_task = asyncio.create_task(reload_surveys())
+    
+    if METRICS_PORT:
+        try:
+            metrics_server = await start_http_server(make_metrics_handler(application), METRICS_LISTEN, METRICS_PORT)
+            logger.info(f"Метрики доступны на http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            logger.error(f"Не удалось запустить эндпоинт метрик: {e}")
+    
+    survey_outbox.open()
+    # Статистика восстанавливается по всем сохраненным опросам до приема обновлений
+    count = await asyncio.to_thread(
+        survey_stats.rebuild, (payload for _, payload in survey_outbox.iter_payloads())
+    )
+    logger.info(f"Статистика восстановлена по {count} сохраненным опросам")
+    outbox_worker = OutboxWorker(
+        survey_outbox,
+        send_survey_data,
+        send_batch=send_survey_batch,
+        batch_size=OUTBOX_BATCH_SIZE,
+        batch_window=OUTBOX_BATCH_WINDOW if API_BULK_SURVEYS_PATH else 0,
+        breaker=backend_breaker
+    )
+    outbox_worker.start()
+    pending = await survey_outbox.pending_count()
+    if pending:
+        logger.info(f"В очереди отправки {pending} недоставленных опросов")
+    
+    async def send_welcome(chat_id: int):
+        await application.bot.send_message(
+            chat_id, WELCOME_MESSAGE, reply_markup=get_main_menu_keyboard(), parse_mode='Markdown'
+        )
+    
+    async def report_broadcast(campaign: dict):
+        if campaign['created_by']:
+            await application.bot.send_message(campaign['created_by'], await format_broadcast_status(campaign))
+    
+    broadcast_store.open()
+    broadcaster = Broadcaster(
+        broadcast_store,
+        send_welcome,
+        rate=BROADCAST_RATE,
+        concurrency=BROADCAST_CONCURRENCY,
+        max_attempts=BROADCAST_MAX_ATTEMPTS,
+        on_result=BROADCAST_MESSAGES.inc,
+        on_finish=report_broadcast
+    )
+    # Рассылка, прерванная остановкой или сбоем, продолжается с неотправленных чатов
+    campaign = await broadcast_store.campaign(statuses=('running',))
+    if campaign is not None:
+        logger.info(f"Продолжаю рассылку №{campaign['id']}: {await broadcast_store.stats(campaign['id'])}")
+        broadcaster.start(campaign['id'])
+
+async def post_stop(application: Application):
+    """Вызывается после остановки получения обновлений, пока бот еще может отправлять сообщения"""
+    global broadcaster
+    # Рассылка остается в статусе running и продолжится после запуска
+    if broadcaster is not None:
+        await broadcaster.stop()
+        broadcaster = None
+
+async def post_shutdown(application: Application):
+    """Вызывается при остановке приложения"""
+    global http_client, outbox_worker, session_eviction_task, metrics_server, survey_reload_task
+    if session_eviction_task is not None:
+        session_eviction_task.cancel()
+        session_eviction_task = None
+    if survey_reload_task is not None:
+        survey_reload_task.cancel()
+        survey_reload_task = None
+    
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+        metrics_server = None
+    
+    if outbox_worker is not None:
+        await outbox_worker.stop()
+        outbox_worker = None
+    survey_outbox.close()
+    
+    broadcast_store.close()
+    
+    await token_cache.close()
+    logger.info(f"Состояние размыкателя бэкенда: {backend_breaker.snapshot()}")
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+# Сборка приложения
+def build_application() -> Application:
+    """Создает Application со всеми обработчиками бота"""
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .persistence(session_persistence)
+        .rate_limiter(bot_rate_limiter)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+    )
+    
+    # Разные пользователи обрабатываются параллельно, один пользователь - по порядку
+    if MAX_CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    
+    if TELEGRAM_API_BASE_URL:
+        base_url = TELEGRAM_API_BASE_URL.rstrip('/')
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    
+    application = builder.build()
+    
+    # Каждое обновление попадает в журнал шагов опроса
+    application.add_handler(CommandHandler("start", log_step(start_command)))
+    application.add_handler(CommandHandler("menu", log_step(menu_command)))
+    application.add_handler(CommandHandler("help", log_step(help_command)))
+    application.add_handler(CommandHandler("status", log_step(status_command)))
+    application.add_handler(CommandHandler("broadcast", log_step(broadcast_command)))
+    application.add_handler(CommandHandler("stats", log_step(stats_command)))
+    
+    application.add_handler(CallbackQueryHandler(log_step(handle_button_click)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, log_step(handle_message)))
+    
+    application.add_error_handler(error)
+    return application
+
 # Главная функция
 def main():
-    # Создаем папку logs если ее нет
-    os.makedirs('logs', exist_ok=True)
+    # Создаем папку логов если ее нет
+    os.makedirs(logs_dir, exist_ok=True)
 
     print("Запускаю бота опроса...")
     
@@ -1013,20 +1615,19 @@ def main():
     logging.getLogger('telegram.ext.dispatcher').setLevel(logging.WARNING)
     logging.getLogger('telegram.ext.jobqueue').setLevel(logging.WARNING)
     
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("menu", menu_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("status", status_command))
-    
-    application.add_handler(CallbackQueryHandler(handle_button_click))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    
-    application.add_error_handler(error)
+    application = build_application()
     
     print("Бот запущен! Нажмите Ctrl+C для остановки.")
     
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_SECRET:
+            raise SystemExit("Для режима webhook задайте WEBHOOK_SECRET в .env")
+        try:
+            asyncio.run(run_webhook(application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL))
+        except KeyboardInterrupt:
+            print("\nБот остановлен.")
+        return
+    
     # ИСПРАВЛЕНИЕ ДЛЯ PYTHON 3.14 - вариант 2
     try:
         application.run_polling()
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger('survey_bot.broadcast')
+
+# Кампании рассылки и состояние доставки по каждому чату (контрольная точка для продолжения)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    source TEXT NOT NULL,
+    created_by INTEGER,
+    status TEXT NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    campaign_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at REAL,
+    PRIMARY KEY (campaign_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries (campaign_id, status, chat_id);
+"""
+
+# Статусы кампании: draft - ждет подтверждения, running - идет (продолжается после перезапуска),
+# paused - приостановлена администратором, done - завершена, cancelled - отменена
+ACTIVE_STATUSES = ('draft', 'running', 'paused')
+
+# Статусы доставки: pending - ждет отправки, sent - доставлено,
+# blocked - бот заблокирован или пользователь удален, failed - ошибка без повтора
+DELIVERY_STATUSES = ('pending', 'sent', 'blocked', 'failed')
+
+
+def read_chat_ids(path: str):
+    """Идентификаторы чатов из файла: первое поле каждой строки; пустые строки и # - пропускаются"""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            field = line.replace(';', ',').split(',')[0].split()[0]
+            try:
+                yield int(field)
+            except ValueError:
+                logger.warning(f"{path}:{line_number}: не идентификатор чата: {field!r}")
+
+
+class BroadcastStore:
+    """Кампании рассылки на SQLite (WAL): кому отправлено, кому нет и почему"""
+
+    # Сколько получателей вставлять одной транзакцией при создании кампании
+    INSERT_CHUNK = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _create(self, source: str, created_by: int | None, chat_ids) -> tuple[int, int]:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN")
+            try:
+                campaign_id = conn.execute(
+                    "INSERT INTO campaigns (created_at, source, created_by, status) VALUES (?, ?, ?, 'draft')",
+                    (time.time(), source, created_by)
+                ).lastrowid
+                chunk = []
+                for chat_id in chat_ids:
+                    chunk.append((campaign_id, chat_id))
+                    if len(chunk) >= self.INSERT_CHUNK:
+                        conn.executemany("INSERT OR IGNORE INTO deliveries (campaign_id, chat_id) VALUES (?, ?)", chunk)
+                        chunk.clear()
+                conn.executemany("INSERT OR IGNORE INTO deliveries (campaign_id, chat_id) VALUES (?, ?)", chunk)
+                count = conn.execute("SELECT COUNT(*) FROM deliveries WHERE campaign_id = ?", (campaign_id,)).fetchone()[0]
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return campaign_id, count
+
+    async def create(self, source: str, created_by: int | None, chat_ids) -> tuple[int, int]:
+        """Создает кампанию-черновик; chat_ids - любой итерируемый источник (повторы отбрасываются).
+
+        Возвращает (id кампании, число получателей).
+        """
+        return await asyncio.to_thread(self._create, source, created_by, chat_ids)
+
+    async def set_status(self, campaign_id: int, status: str):
+        finished_at = time.time() if status not in ACTIVE_STATUSES else None
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE campaigns SET status = ?, finished_at = ? WHERE id = ?",
+            (status, finished_at, campaign_id)
+        )
+
+    async def campaign(self, campaign_id: int | None = None, statuses: tuple = ()) -> dict | None:
+        """Кампания по id или последняя кампания в одном из статусов"""
+        if campaign_id is not None:
+            sql, params = "SELECT id, created_at, source, created_by, status, finished_at FROM campaigns WHERE id = ?", (campaign_id,)
+        else:
+            placeholders = ", ".join("?" * len(statuses))
+            sql = (f"SELECT id, created_at, source, created_by, status, finished_at FROM campaigns "
+                   f"WHERE status IN ({placeholders}) ORDER BY id DESC LIMIT 1")
+            params = tuple(statuses)
+        rows = await asyncio.to_thread(self._execute, sql, params)
+        if not rows:
+            return None
+        keys = ('id', 'created_at', 'source', 'created_by', 'status', 'finished_at')
+        return dict(zip(keys, rows[0]))
+
+    async def pending(self, campaign_id: int, after: int | None, limit: int) -> list[int]:
+        """Следующие неотправленные чаты кампании по возрастанию chat_id после after"""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT chat_id FROM deliveries WHERE campaign_id = ? AND status = 'pending' AND chat_id > ? "
+            "ORDER BY chat_id LIMIT ?",
+            (campaign_id, after if after is not None else -(1 << 63), limit)
+        )
+        return [chat_id for chat_id, in rows]
+
+    async def record(self, campaign_id: int, chat_id: int, outcome: str, error: str | None, max_attempts: int):
+        """Записывает результат попытки; outcome 'retry' оставляет чат в pending, пока не исчерпаны попытки"""
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE deliveries SET attempts = attempts + 1, last_error = ?, updated_at = ?, status = CASE "
+            "WHEN ? != 'retry' THEN ? WHEN attempts + 1 < ? THEN 'pending' ELSE 'failed' END "
+            "WHERE campaign_id = ? AND chat_id = ?",
+            (error, time.time(), outcome, outcome, max_attempts, campaign_id, chat_id)
+        )
+
+    async def stats(self, campaign_id: int) -> dict[str, int]:
+        """Число чатов кампании по статусам доставки"""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT status, COUNT(*) FROM deliveries WHERE campaign_id = ? GROUP BY status",
+            (campaign_id,)
+        )
+        stats = dict.fromkeys(DELIVERY_STATUSES, 0)
+        stats.update(rows)
+        return stats
+
+    async def top_errors(self, campaign_id: int, limit: int = 5) -> list[tuple[str, int]]:
+        """Самые частые ошибки доставки кампании"""
+        return await asyncio.to_thread(
+            self._execute,
+            "SELECT last_error, COUNT(*) AS n FROM deliveries WHERE campaign_id = ? AND status IN ('blocked', 'failed') "
+            "GROUP BY last_error ORDER BY n DESC LIMIT ?",
+            (campaign_id, limit)
+        )
+
+
+class Broadcaster:
+    """Рассылка кампании: очередь получателей, темп rate сообщений в секунду,
+    не больше concurrency одновременных отправок.
+
+    send(chat_id) отправляет одно сообщение. Результат каждой попытки сразу
+    записывается в хранилище, поэтому после сбоя рассылка продолжается с
+    неотправленных чатов; повторно могут уйти лишь сообщения, которые были
+    в полете в момент сбоя (не больше concurrency). Сетевые ошибки и flood
+    wait повторяются до max_attempts раз, заблокировавшие бота чаты - нет.
+    """
+
+    # Сколько получателей читать из хранилища за раз
+    FETCH_SIZE = 200
+
+    def __init__(self, store: BroadcastStore, send, rate: float = 20, concurrency: int = 8,
+                 max_attempts: int = 3, retry_delay: float = 30.0, on_result=None, on_finish=None):
+        self.store = store
+        self.send = send
+        self.rate = rate
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # on_result(outcome) - после каждой попытки, on_finish(campaign) - по завершении кампании
+        self.on_result = on_result
+        self.on_finish = on_finish
+        self.campaign_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, campaign_id: int):
+        if self.running:
+            raise RuntimeError(f"Уже идет рассылка кампании {self.campaign_id}")
+        self.campaign_id = campaign_id
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(campaign_id))
+
+    async def stop(self):
+        """Останавливает рассылку: отправки в полете завершаются, остальные чаты остаются в pending"""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await self._task
+        except Exception as e:
+            logger.error(f"Рассылка кампании {self.campaign_id} завершилась с ошибкой: {e}")
+        self._task = None
+
+    async def _run(self, campaign_id: int):
+        bucket = TokenBucket(self.rate, 1)
+        queue: asyncio.Queue[int] = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(campaign_id, queue, bucket)) for _ in range(self.concurrency)]
+        logger.info(f"Рассылка кампании {campaign_id} запущена: {self.rate} сообщ./с, потоков {self.concurrency}")
+        try:
+            while not self._stopping:
+                after = None
+                while not self._stopping:
+                    chat_ids = await self.store.pending(campaign_id, after, self.FETCH_SIZE)
+                    if not chat_ids:
+                        break
+                    for chat_id in chat_ids:
+                        if self._stopping:
+                            break
+                        await queue.put(chat_id)
+                    after = chat_ids[-1]
+                await queue.join()
+
+                # Проход закончен; в pending остались только чаты с временными ошибками
+                if self._stopping or not await self.store.pending(campaign_id, None, 1):
+                    break
+                await self._sleep(self.retry_delay)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        stats = await self.store.stats(campaign_id)
+        if self._stopping:
+            logger.info(f"Рассылка кампании {campaign_id} остановлена: {stats}")
+            return
+        await self.store.set_status(campaign_id, 'done')
+        logger.info(f"Рассылка кампании {campaign_id} завершена: {stats}")
+        if self.on_finish is not None:
+            try:
+                await self.on_finish(await self.store.campaign(campaign_id))
+            except Exception as e:
+                logger.warning(f"Ошибка обработчика завершения рассылки: {e}")
+
+    async def _sleep(self, seconds: float):
+        # Остановка не ждет окончания паузы между проходами
+        deadline = time.monotonic() + seconds
+        while not self._stopping and time.monotonic() < deadline:
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+    async def _worker(self, campaign_id: int, queue: asyncio.Queue, bucket: TokenBucket):
+        while True:
+            chat_id = await queue.get()
+            try:
+                if self._stopping:
+                    continue
+                await bucket.acquire()
+                outcome, error = await self._deliver(chat_id)
+                await self.store.record(campaign_id, chat_id, outcome, error, self.max_attempts)
+                if self.on_result is not None:
+                    self.on_result(outcome)
+            except Exception as e:
+                logger.error(f"Рассылка: не удалось обработать чат {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, chat_id: int) -> tuple[str, str | None]:
+        try:
+            await self.send(chat_id)
+            return 'sent', None
+        except Forbidden as e:
+            return 'blocked', str(e)
+        except BadRequest as e:
+            # BadRequest - подкласс NetworkError, но повтор не поможет (например, чат не найден)
+            return 'failed', str(e)
+        except (RetryAfter, NetworkError) as e:
+            return 'retry', str(e)
+        except TelegramError as e:
+            return 'failed', str(e)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('survey_bot.circuit_breaker')
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен без обращения к бэкенду: размыкатель открыт"""
+
+
+class CircuitBreaker:
+    """Размыкатель цепи и ограничение числа одновременных запросов к бэкенду.
+
+    После failure_threshold ошибок подряд размыкатель открывается, и все
+    запросы сразу завершаются CircuitOpenError. Через reset_timeout секунд
+    пропускается один пробный запрос: успех закрывает размыкатель, ошибка
+    снова открывает его. Одновременно выполняется не больше max_concurrent
+    запросов, остальные ждут своей очереди.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_concurrent: int = 4, is_failure=None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.max_concurrent = max_concurrent
+        # is_failure(result) -> bool: считать ли успешно полученный результат ошибкой (например, ответ 5xx)
+        self.is_failure = is_failure or (lambda result: False)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {
+            'calls': 0,
+            'failures': 0,
+            'rejected': 0,
+            'opened': 0
+        }
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.retry_in() == 0:
+            return self.HALF_OPEN
+        return self._state
+
+    def retry_in(self) -> float:
+        """Сколько секунд осталось до пробного запроса (0 - запросы пропускаются)"""
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def _check(self):
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = True
+            logger.info(f"{self.name}: пробный запрос после паузы")
+            return
+        self.stats['rejected'] += 1
+        raise CircuitOpenError(f"{self.name} недоступен, повтор через {self.retry_in():.0f} с")
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.stats['opened'] += 1
+        logger.warning(
+            f"{self.name}: размыкатель открыт после {self.consecutive_failures} ошибок подряд, "
+            f"запросы отклоняются {self.reset_timeout:.0f} с "
+            f"(выполняется {self.in_flight}, ожидают {self.waiting})"
+        )
+
+    def _record(self, failed: bool, trial: bool):
+        if trial:
+            self._trial_in_flight = False
+        if not failed:
+            if self._state != self.CLOSED:
+                logger.info(f"{self.name}: размыкатель закрыт, бэкенд снова отвечает")
+            self._state = self.CLOSED
+            self.consecutive_failures = 0
+            return
+
+        self.stats['failures'] += 1
+        self.consecutive_failures += 1
+        if trial or (self._state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._open()
+
+    async def call(self, func, *args, **kwargs):
+        """Выполняет func(*args, **kwargs) через размыкатель; при открытом размыкателе - CircuitOpenError"""
+        self._check()
+        trial = self._state == self.HALF_OPEN
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        except asyncio.CancelledError:
+            if trial:
+                self._trial_in_flight = False
+            raise
+        finally:
+            self.waiting -= 1
+
+        try:
+            # Пока запрос ждал очереди, размыкатель мог открыться
+            if not trial and self._state == self.OPEN:
+                self.stats['rejected'] += 1
+                raise CircuitOpenError(f"{self.name} недоступен, повтор через {self.retry_in():.0f} с")
+
+            self.stats['calls'] += 1
+            self.in_flight += 1
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                if trial:
+                    self._trial_in_flight = False
+                raise
+            except Exception:
+                self._record(True, trial)
+                raise
+            finally:
+                self.in_flight -= 1
+
+            self._record(self.is_failure(result), trial)
+            return result
+        finally:
+            self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        """Текущее состояние для логов и метрик"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            **self.stats
+        }
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger('survey_bot.http')
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+
+class HTTPRequest:
+    """Разобранный HTTP-запрос"""
+
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method: str, target: str, headers: dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b'null')
+
+    def form(self) -> dict[str, str]:
+        """Тело запроса как форма (application/x-www-form-urlencoded) или JSON-объект"""
+        if self.headers.get('content-type', '').startswith('application/json'):
+            return self.json() or {}
+        return {key: values[-1] for key, values in parse_qs(self.body.decode('utf-8')).items()}
+
+
+def json_response(data, status: int = 200) -> tuple[int, str, bytes]:
+    return status, 'application/json', json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def text_response(text: str, status: int = 200, content_type: str = 'text/plain; charset=utf-8') -> tuple[int, str, bytes]:
+    return status, content_type, text.encode('utf-8')
+
+
+async def _read_request(reader: asyncio.StreamReader, max_body: int) -> HTTPRequest | int | None:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        return 400
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        return 400
+    if length > max_body:
+        return 413
+    body = await reader.readexactly(length) if length else b''
+    return HTTPRequest(method.upper(), target, headers, body)
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes, keep_alive: bool):
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Unknown')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def start_http_server(handler, host: str, port: int, max_body: int = 1024 * 1024) -> asyncio.AbstractServer:
+    """Запускает минимальный асинхронный HTTP/1.1 сервер.
+
+    handler(request) -> (статус, content-type, тело) вызывается для каждого запроса.
+    """
+
+    async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await _read_request(reader, max_body)
+                if request is None:
+                    break
+                if isinstance(request, int):
+                    await _write_response(writer, *text_response(STATUS_TEXT[request], request), keep_alive=False)
+                    break
+
+                try:
+                    status, content_type, body = await handler(request)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки HTTP-запроса {request.method} {request.path}: {e}")
+                    status, content_type, body = text_response(STATUS_TEXT[500], 500)
+
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await _write_response(writer, status, content_type, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Сервер останавливается - просто закрываем соединение
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    return await asyncio.start_server(handle_connection, host, port)
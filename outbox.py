@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('survey_bot.outbox')
+
+# Схема локальной очереди отправки опросов
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    user_id INTEGER,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    delivered_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (delivered_at, next_attempt_at);
+"""
+
+
+class SurveyOutbox:
+    """Локальная очередь опросов на SQLite (WAL).
+
+    Записи только добавляются и помечаются доставленными, поэтому ответы
+    не теряются при недоступности бэкенда или перезапуске бота.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _execute_many(self, sql: str, rows: list[tuple]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _insert(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).lastrowid
+
+    async def put(self, survey_data: dict, user_id: int | None = None) -> int:
+        """Сохраняет опрос в очередь и возвращает id записи"""
+        payload = json.dumps(survey_data, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        return await asyncio.to_thread(
+            self._insert,
+            "INSERT INTO outbox (created_at, user_id, payload, next_attempt_at) VALUES (?, ?, ?, ?)",
+            (now, user_id, payload, now)
+        )
+
+    async def fetch_due(self, limit: int = 50) -> list[tuple[int, dict, int]]:
+        """Возвращает недоставленные записи, срок повторной отправки которых наступил"""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT id, payload, attempts FROM outbox "
+            "WHERE delivered_at IS NULL AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (time.time(), limit)
+        )
+        return [(row_id, json.loads(payload), attempts) for row_id, payload, attempts in rows]
+
+    async def next_attempt_at(self) -> float | None:
+        """Время ближайшей запланированной попытки отправки"""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT MIN(next_attempt_at) FROM outbox WHERE delivered_at IS NULL"
+        )
+        return rows[0][0] if rows else None
+
+    async def mark_delivered(self, row_id: int):
+        await self.mark_delivered_many([row_id])
+
+    async def mark_delivered_many(self, row_ids: list[int]):
+        """Помечает доставленными несколько записей одной транзакцией"""
+        now = time.time()
+        await asyncio.to_thread(
+            self._execute_many,
+            "UPDATE outbox SET delivered_at = ?, last_error = NULL WHERE id = ?",
+            [(now, row_id) for row_id in row_ids]
+        )
+
+    async def mark_failed(self, row_id: int, attempts: int, retry_at: float, error: str = ""):
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            (attempts, retry_at, error, row_id)
+        )
+
+    async def pending_count(self) -> int:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT COUNT(*) FROM outbox WHERE delivered_at IS NULL"
+        )
+        return rows[0][0]
+
+    def iter_payloads(self, since: float | None = None, until: float | None = None, batch_size: int = 1000):
+        """Сохраненные опросы по порядку записи: (created_at, данные опроса).
+
+        since/until (unix time) ограничивают время записи: since <= created_at < until.
+        Читает пачками по batch_size, поэтому память не зависит от размера
+        очереди. Блокирующий генератор - в боте его обходят в отдельном потоке.
+        """
+        last_id = 0
+        since = since if since is not None else float('-inf')
+        until = until if until is not None else float('inf')
+        while True:
+            rows = self._execute(
+                "SELECT id, created_at, payload FROM outbox WHERE id > ? AND created_at >= ? AND created_at < ? "
+                "ORDER BY id LIMIT ?",
+                (last_id, since, until, batch_size)
+            )
+            for _, created_at, payload in rows:
+                yield created_at, json.loads(payload)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    async def user_ids(self) -> list[int]:
+        """Пользователи, когда-либо завершившие опрос"""
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT DISTINCT user_id FROM outbox WHERE user_id IS NOT NULL"
+        )
+        return [user_id for user_id, in rows]
+
+
+class OutboxWorker:
+    """Фоновая доставка записей очереди с экспоненциальной задержкой повторов.
+
+    send(payload) -> bool отправляет одну запись. Необязательный
+    send_batch(payloads) -> list[bool] | None отправляет пачку одним запросом;
+    None означает, что пакетная отправка недоступна, и записи уходят поштучно.
+    Пока размыкатель breaker открыт, записи не отправляются и не тратят попытки.
+    """
+
+    def __init__(self, outbox: SurveyOutbox, send, base_delay: float = 2.0,
+                 max_delay: float = 300.0, poll_interval: float = 30.0,
+                 send_batch=None, batch_size: int = 50, batch_window: float = 0.0,
+                 breaker=None):
+        self.outbox = outbox
+        self.send = send
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.breaker = breaker
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self):
+        """Будит воркер после добавления новой записи"""
+        self._wakeup.set()
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                delivered = await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди отправки: {e}")
+                delivered = 0
+
+            if delivered:
+                continue
+            await self._wait()
+
+    def _paused_for(self) -> float:
+        """Сколько секунд бэкенд еще считается недоступным"""
+        return self.breaker.retry_in() if self.breaker is not None else 0.0
+
+    async def _wait(self):
+        timeout = self.poll_interval
+        try:
+            next_at = await self.outbox.next_attempt_at()
+        except Exception:
+            next_at = None
+        if next_at is not None:
+            timeout = max(0.0, min(timeout, next_at - time.time()))
+        # Размыкатель открыт - ждем пробного запроса, даже если есть записи к отправке
+        timeout = max(timeout, self._paused_for())
+
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return
+
+        # Даем накопиться пачке опросов, завершенных почти одновременно
+        if self.batch_window > 0:
+            await asyncio.sleep(self.batch_window)
+
+    async def drain(self) -> int:
+        """Отправляет все записи, срок которых наступил; возвращает число доставленных"""
+        paused_for = self._paused_for()
+        if paused_for > 0:
+            logger.warning(f"Бэкенд недоступен, отправка отложена на {paused_for:.0f} с, "
+                           f"в очереди {await self.outbox.pending_count()} опросов")
+            return 0
+
+        rows = await self.outbox.fetch_due(self.batch_size)
+        if not rows:
+            return 0
+
+        statuses = None
+        if self.send_batch is not None and len(rows) > 1:
+            try:
+                statuses = await self.send_batch([survey_data for _, survey_data, _ in rows])
+            except Exception as e:
+                logger.error(f"Ошибка пакетной отправки очереди: {e}")
+                statuses = [False] * len(rows)
+            errors = ["batch item rejected"] * len(rows)
+
+        if statuses is None:
+            statuses, errors = [], []
+            for _, survey_data, _ in rows:
+                # Размыкатель открылся - оставшиеся записи ждут без увеличения числа попыток
+                if self._paused_for() > 0:
+                    break
+                try:
+                    success = await self.send(survey_data)
+                    error = "" if success else "backend rejected"
+                except Exception as e:
+                    success = False
+                    error = str(e)
+                statuses.append(success)
+                errors.append(error)
+
+        delivered = [row_id for (row_id, _, _), success in zip(rows, statuses) if success]
+        if delivered:
+            await self.outbox.mark_delivered_many(delivered)
+            logger.info(f"Записи очереди доставлены: {delivered}")
+
+        for (row_id, _, attempts), success, error in zip(rows, statuses, errors):
+            if success:
+                continue
+            attempts += 1
+            delay = self.backoff(attempts)
+            await self.outbox.mark_failed(row_id, attempts, time.time() + delay, error)
+            logger.warning(f"Запись очереди {row_id} не доставлена (попытка {attempts}), повтор через {delay:.0f} с")
+        return len(delivered)
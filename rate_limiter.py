@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from tracing import add_span, span
+
+logger = logging.getLogger('survey_bot.rate_limiter')
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не более capacity подряд"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until', 'lock')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # Lock в asyncio отдает очередь в порядке поступления (FIFO)
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def idle(self) -> bool:
+        """Ведро полное и никто его не ждет - его можно выбросить"""
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and not self.lock.locked() and self.paused_until <= time.monotonic()
+
+    async def acquire(self) -> float:
+        """Забирает токен, возвращает время ожидания в секундах"""
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов (flood wait от Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class FairRateLimiter(BaseRateLimiter):
+    """Ограничение запросов к Bot API по глобальному лимиту и лимиту на чат.
+
+    Запрос сначала ждет токен своего чата, а затем встает в общую FIFO-очередь
+    глобального лимита, поэтому активный пользователь не вытесняет остальных.
+    RetryAfter обрабатывается автоматически: лимит ставится на паузу и запрос
+    повторяется.
+    """
+
+    # Предел числа ведер чатов, после которого простаивающие удаляются
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, overall_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3, max_retries: int = 3):
+        self.overall_rate = overall_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._overall = TokenBucket(overall_rate, overall_rate)
+        self._chats: dict[Any, TokenBucket] = {}
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'retry_after': 0,
+            'failed_after_retries': 0
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        logger.info(f"Статистика ограничения запросов к Bot API: {self.stats}")
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                for key in [key for key, value in self._chats.items() if value.idle()]:
+                    del self._chats[key]
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _acquire(self, chat_id) -> float:
+        waited = 0.0
+        if chat_id is not None:
+            waited += await self._chat_bucket(chat_id).acquire()
+        waited += await self._overall.acquire()
+        if waited > 0:
+            self.stats['throttled'] += 1
+            self.stats['throttled_seconds'] += waited
+        return waited
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: dict | None,
+    ):
+        max_retries = (rate_limit_args or {}).get('max_retries', self.max_retries)
+        chat_id = data.get('chat_id') if data else None
+        self.stats['requests'] += 1
+
+        attempt = 0
+        while True:
+            waited = await self._acquire(chat_id)
+            if waited > 0:
+                add_span('bot_api.throttle', waited)
+            try:
+                with span(f'bot_api.{endpoint}'):
+                    return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+                self.stats['retry_after'] += 1
+                attempt += 1
+                if attempt > max_retries:
+                    self.stats['failed_after_retries'] += 1
+                    raise
+
+                logger.warning(f"Flood wait от Telegram для {endpoint} (чат {chat_id}): пауза {retry_after:.1f} с, попытка {attempt}")
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(retry_after)
+                else:
+                    self._overall.pause(retry_after)
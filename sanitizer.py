@@ -0,0 +1,38 @@
+import re
+
+# Одна альтернатива вместо шести последовательных re.sub.
+# Порядок ветвей повторяет прежний порядок проходов. Слова admin/root/test
+# проверялись последними, уже после замены остальных фрагментов на [removed],
+# поэтому граница слова для них засчитывается и сразу после удаленного
+# <script или \xHH, и прямо перед удаляемым javascript:.
+# Опережающая проверка первого символа быстро пропускает позиции, с которых
+# не начинается ни одна ветвь
+DANGEROUS_PATTERN = re.compile(
+    r"(?=[-;/*<>\\adijrstu])(?:"
+    r"\b(?:DROP|DELETE|INSERT|UPDATE|SELECT|UNION)\b"
+    r"|--|;|/\*|\*/"
+    r"|<script|</script>|javascript:"
+    r"|\\x[0-9a-fA-F]{2}"
+    r"|(?:(?<!\w)|(?<=<script)|(?<=\\x[0-9a-fA-F]{2}))(?:admin|root|test)(?:\b|(?=javascript:))"
+    r"|[<>])",
+    re.IGNORECASE
+)
+
+# Символы, без которых ни одна ветвь не совпадет: латиница (и символы, равные ей
+# без учета регистра: İ ı ſ K) и -;/*<>\. Обычный русский текст их не содержит
+SUSPICIOUS_CHARS = re.compile(r"[a-zA-Z\u0130\u0131\u017f\u212a\-;/*<>\\]")
+
+# Символ, который остается после удаления спецсимволов и не является пробелом
+MEANINGFUL_CHAR = re.compile(r"[\w.,!?;:()\-]")
+
+
+def sanitize_text(text: str, max_length: int = 1000) -> str:
+    """Заменяет опасные фрагменты на [removed], обрезает до max_length и убирает пробелы по краям"""
+    if SUSPICIOUS_CHARS.search(text) is not None:
+        text = DANGEROUS_PATTERN.sub('[removed]', text)
+    return text[:max_length].strip()
+
+
+def has_meaningful_text(text: str) -> bool:
+    """Есть ли в тексте что-то кроме спецсимволов и пробелов"""
+    return MEANINGFUL_CHAR.search(text) is not None
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger('survey_bot.sessions')
+
+# Ключи user_data, которые переживают перезапуск бота
+PERSISTED_KEYS = ('survey', 'answers', 'current_question', 'branch', 'selected', 'question_prefix', 'telegram_user')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at);
+"""
+
+
+class SQLiteSessionPersistence(BasePersistence):
+    """Хранение незавершенных опросов (user_data) в SQLite.
+
+    PTB вызывает update_user_data раз в update_interval секунд только для
+    изменившихся пользователей, а все такие изменения записываются одной
+    транзакцией. Сессии без активности дольше session_ttl удаляются.
+    """
+
+    def __init__(self, path: str, session_ttl: float = 24 * 3600, update_interval: float = 10):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.path = path
+        self.session_ttl = session_ttl
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._write_lock = asyncio.Lock()
+        self._pending: dict[int, dict | None] = {}
+        # user_id -> время последнего обновления от пользователя
+        self._last_seen: dict[int, float] = {}
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def _snapshot(user_data: dict) -> dict:
+        return {key: user_data[key] for key in PERSISTED_KEYS if key in user_data}
+
+    @staticmethod
+    def _encode(value):
+        # Компактные записи (например, снимок пользователя) сохраняются как кортеж полей
+        if hasattr(value, 'as_tuple'):
+            return value.as_tuple()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def _load(self) -> dict[int, dict]:
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.session_ttl,))
+            rows = conn.execute("SELECT user_id, data, updated_at FROM sessions").fetchall()
+        result = {}
+        for user_id, data, updated_at in rows:
+            result[user_id] = json.loads(data)
+            self._last_seen[user_id] = updated_at
+        return result
+
+    def _write(self, batch: dict[int, dict | None]):
+        now = time.time()
+        upserts = [(user_id, json.dumps(data, ensure_ascii=False, default=self._encode), now) for user_id, data in batch.items() if data]
+        deletes = [(user_id,) for user_id, data in batch.items() if not data]
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                if upserts:
+                    conn.executemany(
+                        "INSERT INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                        upserts
+                    )
+                if deletes:
+                    conn.executemany("DELETE FROM sessions WHERE user_id = ?", deletes)
+
+    async def _flush_pending(self):
+        # Даем остальным вызовам текущего цикла сохранения попасть в тот же пакет
+        await asyncio.sleep(0)
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            await asyncio.to_thread(self._write, batch)
+
+    def idle_users(self) -> list[int]:
+        """Пользователи без активности дольше session_ttl"""
+        deadline = time.time() - self.session_ttl
+        return [user_id for user_id, last_seen in self._last_seen.items() if last_seen < deadline]
+
+    def _user_ids(self) -> list[int]:
+        with self._lock:
+            return [user_id for user_id, in self._connect().execute("SELECT user_id FROM sessions")]
+
+    async def user_ids(self) -> list[int]:
+        """Пользователи с сохраненной сессией (в том числе ожидающей вытеснения)"""
+        return await asyncio.to_thread(self._user_ids)
+
+    @property
+    def active_sessions(self) -> int:
+        return len(self._last_seen)
+
+    async def get_user_data(self) -> dict[int, dict]:
+        user_data = await asyncio.to_thread(self._load)
+        logger.info(f"Восстановлено незавершенных опросов: {len(user_data)}")
+        return user_data
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._pending[user_id] = self._snapshot(data)
+        await self._flush_pending()
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        self._last_seen[user_id] = time.time()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._last_seen.pop(user_id, None)
+        self._pending[user_id] = None
+        await self._flush_pending()
+
+    async def flush(self) -> None:
+        await self._flush_pending()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # Остальные данные бот не хранит
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,87 @@
+import logging
+from collections import Counter
+
+logger = logging.getLogger('survey_bot.stats')
+
+# Филиал, если респондент его не указал (например, досрочный выход из опроса)
+NO_FILIAL = "не указан"
+
+
+class SurveyAggregate:
+    """Счетчики ответов одного опроса: всего, по филиалам и по филиалам для каждого вопроса"""
+
+    __slots__ = ('total', 'filials', 'answers', 'by_filial', 'question_texts')
+
+    def __init__(self):
+        self.total = 0
+        self.filials = Counter()
+        # questionId -> Counter(ответ)
+        self.answers: dict[str, Counter] = {}
+        # questionId -> филиал -> Counter(ответ)
+        self.by_filial: dict[str, dict[str, Counter]] = {}
+        self.question_texts: dict[str, str] = {}
+
+
+class SurveyStats:
+    """Накопительная статистика завершенных опросов по данным format_survey_data.
+
+    add() обновляет счетчики за время, не зависящее от числа собранных
+    опросов, поэтому /stats не читает сохраненные ответы. Счетчики живут
+    в памяти и при запуске восстанавливаются из очереди отправки (rebuild).
+    Ответы вопросов из multi_questions (множественный выбор, варианты через
+    запятую) считаются по каждому варианту отдельно. Вопросы, ответ на
+    которые передается полем респондента (например, filial), задаются в
+    respondent_questions: поле -> questionId.
+    """
+
+    def __init__(self, questions, multi_questions=(), respondent_questions=None):
+        self.questions = frozenset(questions)
+        self.multi_questions = frozenset(multi_questions)
+        self.respondent_questions = dict(respondent_questions or {})
+        # Название опроса -> счетчики
+        self.surveys: dict[str, SurveyAggregate] = {}
+
+    def add(self, survey_data: dict):
+        """Учитывает один завершенный опрос"""
+        aggregate = self.surveys.get(survey_data.get('name'))
+        if aggregate is None:
+            aggregate = self.surveys[survey_data.get('name')] = SurveyAggregate()
+        respondent = survey_data.get('respondent', {})
+        filial = respondent.get('filial') or NO_FILIAL
+        aggregate.total += 1
+        aggregate.filials[filial] += 1
+
+        for field, question_id in self.respondent_questions.items():
+            if respondent.get(field) and question_id in self.questions:
+                self._count(aggregate, filial, question_id, respondent[field], None)
+        for answer in survey_data.get('response', {}).get('answers', ()):
+            question_id = answer.get('questionId')
+            if question_id in self.questions:
+                self._count(aggregate, filial, question_id, answer.get('answerText', ''), answer.get('questionText'))
+
+    def _count(self, aggregate: SurveyAggregate, filial: str, question_id: str, text: str, question_text: str | None):
+        values = [value for value in text.split(', ') if value] if question_id in self.multi_questions else [text]
+        counts = aggregate.answers.get(question_id)
+        if counts is None:
+            counts = aggregate.answers[question_id] = Counter()
+            aggregate.by_filial[question_id] = {}
+        if question_text:
+            aggregate.question_texts[question_id] = question_text
+        filial_counts = aggregate.by_filial[question_id].get(filial)
+        if filial_counts is None:
+            filial_counts = aggregate.by_filial[question_id][filial] = Counter()
+        counts.update(values)
+        filial_counts.update(values)
+
+    def rebuild(self, payloads) -> int:
+        """Пересчитывает статистику по итерируемому источнику опросов, возвращает их число"""
+        self.surveys = {}
+        count = 0
+        for survey_data in payloads:
+            try:
+                self.add(survey_data)
+            except (AttributeError, TypeError) as e:
+                logger.warning(f"Пропущен опрос с неожиданной структурой: {e}")
+                continue
+            count += 1
+        return count
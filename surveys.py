@@ -0,0 +1,474 @@
+"""Описания опросов: загрузка из JSON/YAML, проверка и компиляция.
+
+Файл описания (surveys/*.json, *.yaml, *.yml):
+
+    id              идентификатор опроса (латиница, цифры, _ и -; по умолчанию - имя файла)
+    name            название опроса в данных для бэкенда
+    button          текст кнопки запуска в главном меню
+    welcome         сообщение при запуске опроса (по умолчанию - общее приветствие бота)
+    lists           именованные списки вариантов: {"cities": [...]}; в options - "@cities"
+    questions       вопросы по порядку: {ключ: {text, type, ...}}
+    first_question  первый вопрос (по умолчанию - первый в questions)
+    branch_question вопрос, ответ на который задает ветку опроса (переходы 'branch:<ответ>')
+    flow            переходы: {вопрос: {ответ: следующий вопрос или null}}, '*' - любой ответ
+    exits           досрочное завершение: [{question, answer, message}]
+    respondent      поля блока respondent: {поле: вопрос или null}
+
+Типы вопросов: consent, yes_no, choice, multi_choice, text, tab_number.
+У кнопочных вопросов callback задает callback_data кнопок:
+    consent         callback (по умолчанию <ключ>_continue), button - текст кнопки
+    yes_no          yes_<callback> / no_<callback>, при пустом callback - yes / no
+    choice          <callback>_<вариант>, options, columns
+    multi_choice    <callback>_<вариант> и finish_callback (по умолчанию finish_<callback>),
+                    options, columns, other_option (его выбор дает переход 'other'), empty_alert
+По умолчанию callback - ключ вопроса. При callback_values: "index" (или если
+callback_data длиннее 64 байт) вместо текста варианта используется его номер.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger('survey_bot.surveys')
+
+QUESTION_TYPES = ('consent', 'yes_no', 'choice', 'multi_choice', 'text', 'tab_number')
+
+# Вопросы этих типов принимают ответ только кнопками
+BUTTON_TYPES = frozenset(('consent', 'yes_no', 'choice', 'multi_choice'))
+
+YES_NO_ANSWERS = {'yes': "✅ Да", 'no': "❌ Нет"}
+
+SURVEY_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,40}')
+
+# Ограничение Telegram на длину callback_data (байты)
+CALLBACK_DATA_LIMIT = 64
+
+# Предел числа закэшированных клавиатур множественного выбора на вопрос
+MULTI_SELECT_CACHE_SIZE = 1024
+
+DEFINITION_SUFFIXES = ('.json', '.yaml', '.yml')
+
+
+class SurveyError(ValueError):
+    """Ошибка в описании опроса"""
+
+
+def _build_rows(buttons: list, per_row: int) -> list:
+    return [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+
+
+class Question:
+    """Скомпилированный вопрос: текст, тип, варианты и готовые клавиатуры"""
+
+    __slots__ = ('key', 'text', 'type', 'options', 'columns', 'other_option', 'empty_alert', 'callbacks',
+                 'finish_callback', '_keyboard', '_option_bits', '_keyboards')
+
+    def __init__(self, key: str, text: str, question_type: str, options: tuple = (), columns: int = 1,
+                 other_option: str | None = None, empty_alert: str = ""):
+        self.key = key
+        self.text = text
+        self.type = question_type
+        self.options = options
+        self.columns = columns
+        self.other_option = other_option
+        self.empty_alert = empty_alert
+        # callback_data -> (действие, значение); действие: answer, toggle, finish
+        self.callbacks: dict[str, tuple[str, str]] = {}
+        self.finish_callback = None
+        self._keyboard = None
+        self._option_bits = {option: 1 << i for i, option in enumerate(options)}
+        # Маска выбранных вариантов -> клавиатура; LRU на MULTI_SELECT_CACHE_SIZE записей
+        self._keyboards: OrderedDict[int, InlineKeyboardMarkup] = OrderedDict()
+
+    def add_callback(self, data: str, action: str, value: str = ""):
+        _require(data and len(data.encode('utf-8')) <= CALLBACK_DATA_LIMIT,
+                 f"Вопрос {self.key}: callback_data {data!r} пустая или длиннее {CALLBACK_DATA_LIMIT} байт")
+        _require(data not in self.callbacks, f"Вопрос {self.key}: повторяющаяся callback_data {data!r}")
+        self.callbacks[data] = (action, value)
+
+    def callback_for(self, action: str, value: str = "") -> str:
+        """callback_data кнопки (для тестовых сценариев и нагрузочных прогонов)"""
+        for data, button in self.callbacks.items():
+            if button == (action, value):
+                return data
+        raise KeyError((self.key, action, value))
+
+    def markup(self, selected=()) -> InlineKeyboardMarkup | None:
+        """Клавиатура вопроса; у множественного выбора - с отметками выбранных вариантов"""
+        if self.type != 'multi_choice':
+            return self._keyboard
+        mask = 0
+        for item in selected:
+            mask |= self._option_bits.get(item, 0)
+        keyboard = self._keyboards.get(mask)
+        if keyboard is not None:
+            self._keyboards.move_to_end(mask)
+            return keyboard
+        keyboard = self._keyboards[mask] = self._multi_keyboard(mask)
+        if len(self._keyboards) > MULTI_SELECT_CACHE_SIZE:
+            self._keyboards.popitem(last=False)
+        return keyboard
+
+    def _multi_keyboard(self, mask: int) -> InlineKeyboardMarkup:
+        buttons = []
+        for data, (action, value) in self.callbacks.items():
+            if action == 'toggle':
+                mark = "✅" if mask & self._option_bits[value] else "◻️"
+                buttons.append(InlineKeyboardButton(f"{mark} {value}", callback_data=data))
+        keyboard = _build_rows(buttons, self.columns)
+        keyboard.append([InlineKeyboardButton("✅ Завершить выбор", callback_data=self.finish_callback)])
+        return InlineKeyboardMarkup(keyboard)
+
+
+class Survey:
+    """Скомпилированное описание опроса одной версии"""
+
+    __slots__ = ('id', 'version', 'name', 'button', 'welcome', 'questions', 'first_question', 'branch_question',
+                 'transitions', 'branches', 'exits', 'respondent_fields', 'response_questions', 'callbacks', 'source')
+
+    def next_question(self, current_question: str, branch: str | None, answer: str = '*') -> str | None:
+        """Следующий вопрос: переход по ответу, затем по ветке опроса, затем '*'"""
+        answers = self.transitions.get(current_question, _NO_TRANSITIONS)
+        if answer != '*' and answer in answers:
+            return answers[answer]
+        branches = self.branches.get(current_question)
+        if branches and branch in branches:
+            return branches[branch]
+        return answers.get('*')
+
+    def as_tuple(self) -> tuple:
+        """Ссылка на версию опроса для хранилища сессий"""
+        return self.id, self.version
+
+
+_NO_TRANSITIONS = {}
+
+
+def _require(condition, message: str):
+    if not condition:
+        raise SurveyError(message)
+
+
+def _resolve_options(key: str, options, lists: dict) -> tuple:
+    if isinstance(options, str) and options.startswith('@'):
+        _require(options[1:] in lists, f"Вопрос {key}: неизвестный список {options}")
+        options = lists[options[1:]]
+    _require(isinstance(options, list) and options, f"Вопрос {key}: нужен непустой список options")
+    _require(all(isinstance(option, str) and option for option in options), f"Вопрос {key}: варианты должны быть строками")
+    _require(len(set(options)) == len(options), f"Вопрос {key}: повторяющиеся варианты")
+    return tuple(options)
+
+
+def _option_callback(prefix: str, index: int, option: str, by_index: bool) -> str:
+    data = f"{prefix}_{option}"
+    if by_index or len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        data = f"{prefix}_{index}"
+    return data
+
+
+def _compile_question(key: str, spec: dict, lists: dict) -> Question:
+    _require(isinstance(spec, dict), f"Вопрос {key}: ожидается объект")
+    question_type = spec.get('type')
+    _require(question_type in QUESTION_TYPES, f"Вопрос {key}: неизвестный тип {question_type!r}")
+    text = spec.get('text')
+    _require(isinstance(text, str) and text.strip(), f"Вопрос {key}: нет текста")
+
+    options = ()
+    if question_type in ('choice', 'multi_choice'):
+        options = _resolve_options(key, spec.get('options'), lists)
+    columns = spec.get('columns', 1)
+    _require(isinstance(columns, int) and columns > 0, f"Вопрос {key}: columns должно быть положительным числом")
+    other_option = spec.get('other_option')
+    _require(other_option is None or other_option in options, f"Вопрос {key}: other_option нет среди вариантов")
+
+    question = Question(key, text, question_type, options, columns, other_option,
+                        spec.get('empty_alert', "❌ Пожалуйста, выберите хотя бы один вариант."))
+    prefix = spec.get('callback', key)
+    _require(isinstance(prefix, str), f"Вопрос {key}: callback должен быть строкой")
+    by_index = spec.get('callback_values') == 'index'
+
+    if question_type == 'consent':
+        data = spec.get('callback') or f"{key}_continue"
+        question.add_callback(data, 'answer', 'yes')
+        question._keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(spec.get('button', "✅ Продолжить"), callback_data=data)]])
+    elif question_type == 'yes_no':
+        for answer in ('yes', 'no'):
+            question.add_callback(f"{answer}_{prefix}" if prefix else answer, 'answer', answer)
+        question._keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(YES_NO_ANSWERS[answer], callback_data=data)]
+            for data, (_, answer) in question.callbacks.items()
+        ])
+    elif question_type == 'choice':
+        buttons = []
+        for index, option in enumerate(options):
+            data = _option_callback(prefix, index, option, by_index)
+            question.add_callback(data, 'answer', option)
+            buttons.append(InlineKeyboardButton(option, callback_data=data))
+        question._keyboard = InlineKeyboardMarkup(_build_rows(buttons, columns))
+    elif question_type == 'multi_choice':
+        for index, option in enumerate(options):
+            question.add_callback(_option_callback(prefix, index, option, by_index), 'toggle', option)
+        question.finish_callback = spec.get('finish_callback', f"finish_{prefix}")
+        question.add_callback(question.finish_callback, 'finish')
+    return question
+
+
+def _answers_of(question: Question) -> set:
+    """Значения ответа, по которым возможен переход"""
+    if question.type == 'yes_no':
+        return {'yes', 'no'}
+    if question.type == 'choice':
+        return set(question.options)
+    if question.type == 'multi_choice' and question.other_option:
+        return {'other'}
+    return set()
+
+
+def compile_survey(raw: dict, default_id: str = "", reserved_callbacks=frozenset()) -> Survey:
+    """Проверяет описание опроса и собирает вопросы, клавиатуры и таблицу переходов"""
+    _require(isinstance(raw, dict), "Описание опроса должно быть объектом")
+    survey = Survey()
+    survey.id = raw.get('id', default_id)
+    _require(isinstance(survey.id, str) and SURVEY_ID_PATTERN.fullmatch(survey.id),
+             f"Недопустимый id опроса: {survey.id!r}")
+    survey.name = raw.get('name')
+    _require(isinstance(survey.name, str) and survey.name, f"Опрос {survey.id}: нет названия (name)")
+    survey.button = raw.get('button', f"📝 {survey.name}")
+    survey.welcome = raw.get('welcome')
+
+    lists = raw.get('lists', {})
+    _require(isinstance(lists, dict), f"Опрос {survey.id}: lists должен быть объектом")
+    specs = raw.get('questions')
+    _require(isinstance(specs, dict) and specs, f"Опрос {survey.id}: нет вопросов")
+    try:
+        survey.questions = {key: _compile_question(key, spec, lists) for key, spec in specs.items()}
+    except SurveyError as e:
+        raise SurveyError(f"Опрос {survey.id}: {e}") from None
+    questions = survey.questions
+
+    survey.first_question = raw.get('first_question', next(iter(questions)))
+    _require(survey.first_question in questions, f"Опрос {survey.id}: неизвестный первый вопрос {survey.first_question}")
+    survey.branch_question = raw.get('branch_question')
+    _require(survey.branch_question is None or survey.branch_question in questions,
+             f"Опрос {survey.id}: неизвестный вопрос ветвления {survey.branch_question}")
+    branches = _answers_of(questions[survey.branch_question]) if survey.branch_question else set()
+
+    # Таблицы переходов: вопрос -> {ответ: следующий вопрос} и вопрос -> {ветка: следующий вопрос}
+    flow = raw.get('flow')
+    _require(isinstance(flow, dict), f"Опрос {survey.id}: нет переходов (flow)")
+    survey.transitions = {}
+    survey.branches = {}
+    for question_key, answers in flow.items():
+        _require(question_key in questions, f"Опрос {survey.id}: неизвестный вопрос в переходах: {question_key}")
+        _require(isinstance(answers, dict) and answers, f"Опрос {survey.id}: пустые переходы у {question_key}")
+        allowed = _answers_of(questions[question_key])
+        for answer, next_question in answers.items():
+            _require(next_question is None or next_question in questions,
+                     f"Опрос {survey.id}: неизвестный переход {question_key} -> {next_question}")
+            if answer.startswith('branch:'):
+                branch = answer[len('branch:'):]
+                _require(branch in branches, f"Опрос {survey.id}: неизвестная ветка {question_key}: {answer}")
+                survey.branches.setdefault(question_key, {})[branch] = next_question
+            else:
+                _require(answer == '*' or answer in allowed, f"Опрос {survey.id}: неизвестный ответ {question_key}: {answer}")
+                survey.transitions.setdefault(question_key, {})[answer] = next_question
+
+    # Каждый вопрос должен быть достижим и иметь переходы - опечатки в flow не доживают до пользователя
+    reachable, pending = set(), [survey.first_question]
+    while pending:
+        question_key = pending.pop()
+        if question_key in reachable:
+            continue
+        reachable.add(question_key)
+        _require(question_key in flow, f"Опрос {survey.id}: нет переходов после вопроса {question_key}")
+        pending.extend(next_question for next_question in flow[question_key].values() if next_question)
+    unreachable = [key for key in questions if key not in reachable]
+    _require(not unreachable, f"Опрос {survey.id}: недостижимые вопросы: {', '.join(unreachable)}")
+
+    survey.exits = {}
+    for exit_spec in raw.get('exits', []):
+        question_key, answer = exit_spec.get('question'), exit_spec.get('answer')
+        _require(question_key in questions and answer in _answers_of(questions[question_key]),
+                 f"Опрос {survey.id}: неверное досрочное завершение {question_key}: {answer}")
+        _require(isinstance(exit_spec.get('message'), str), f"Опрос {survey.id}: нет сообщения досрочного завершения")
+        survey.exits[(question_key, answer)] = exit_spec['message']
+
+    survey.respondent_fields = raw.get('respondent', {})
+    _require(isinstance(survey.respondent_fields, dict), f"Опрос {survey.id}: respondent должен быть объектом")
+    for field, question_key in survey.respondent_fields.items():
+        _require(question_key is None or question_key in questions, f"Опрос {survey.id}: поле {field} ссылается на неизвестный вопрос")
+    respondent_questions = set(survey.respondent_fields.values())
+    survey.response_questions = tuple(key for key in questions if key not in respondent_questions)
+
+    # callback_data -> (вопрос, действие, значение) по всем кнопкам опроса
+    survey.callbacks = {}
+    for question in questions.values():
+        for data, (action, value) in question.callbacks.items():
+            _require(data not in survey.callbacks and data not in reserved_callbacks,
+                     f"Опрос {survey.id}: callback_data {data!r} используется дважды")
+            survey.callbacks[data] = (question.key, action, value)
+
+    # Порядок ключей значим (порядок вопросов и полей респондента), поэтому он сохраняется
+    # и в архиве, и в хеше версии: перестановка вопросов - новая версия
+    canonical = json.dumps(raw, ensure_ascii=False, separators=(',', ':'))
+    survey.version = hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:10]
+    survey.source = canonical
+    return survey
+
+
+def load_definition(path: str) -> dict:
+    """Читает описание опроса из JSON или YAML"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        if yaml is None:
+            raise SurveyError(f"Для {os.path.basename(path)} нужен PyYAML (pip install pyyaml)")
+        try:
+            return yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise SurveyError(f"Ошибка разбора YAML: {e}") from e
+
+
+class SurveyRegistry:
+    """Опросы из каталога с описаниями, перечитываемые при изменении файлов.
+
+    refresh() сравнивает mtime и размер файлов и компилирует только изменившиеся;
+    описание с ошибкой пишется в лог, а прежняя версия опроса остается в работе.
+    Все загруженные версии сохраняются в archive_dir, поэтому сессия, начатая на
+    старой версии, доходит до конца на ней же - в том числе после перезапуска.
+    """
+
+    def __init__(self, directory: str, archive_dir: str | None = None, default_id: str = "",
+                 reserved_callbacks=frozenset()):
+        self.directory = directory
+        self.archive_dir = archive_dir
+        self.default_id = default_id
+        self.reserved_callbacks = frozenset(reserved_callbacks)
+        # путь -> (mtime_ns, размер, id опроса или None при ошибке)
+        self._files: dict[str, tuple[int, int, str | None]] = {}
+        # id -> текущая версия, в порядке имен файлов
+        self._current: dict[str, Survey] = {}
+        self._versions: dict[tuple[str, str], Survey] = {}
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.name.endswith(DEFINITION_SUFFIXES) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return dict(sorted(files.items()))
+
+    def refresh(self) -> bool:
+        """Перечитывает изменившиеся описания; True, если набор текущих опросов изменился"""
+        try:
+            files = self._scan()
+        except OSError as e:
+            logger.error(f"Не удалось прочитать каталог опросов {self.directory}: {e}")
+            return False
+
+        # Новый набор собирается в копии и подменяется целиком: refresh() может выполняться
+        # в отдельном потоке, пока обработчики читают реестр
+        current_surveys = dict(self._current)
+        changed = False
+        for path in [path for path in self._files if path not in files]:
+            survey_id = self._files.pop(path)[2]
+            if survey_id in current_surveys:
+                logger.info(f"Опрос {survey_id} удален ({os.path.basename(path)}); начатые сессии завершатся на своей версии")
+                del current_surveys[survey_id]
+                changed = True
+
+        for path, (mtime, size) in files.items():
+            known = self._files.get(path)
+            if known is not None and known[:2] == (mtime, size):
+                continue
+            name = os.path.basename(path)
+            previous_id = known[2] if known else None
+            try:
+                survey = compile_survey(load_definition(path), os.path.splitext(name)[0], self.reserved_callbacks)
+            except (OSError, ValueError) as e:
+                # Прежняя версия опроса (если была) продолжает работать
+                logger.error(f"Описание опроса {name} не загружено: {e}")
+                self._files[path] = (mtime, size, previous_id)
+                continue
+
+            self._files[path] = (mtime, size, survey.id)
+            owner = next((other for other, entry in self._files.items() if other != path and entry[2] == survey.id), None)
+            if owner is not None:
+                logger.error(f"Описание опроса {name} не загружено: id {survey.id} уже занят файлом {os.path.basename(owner)}")
+                self._files[path] = (mtime, size, None)
+                continue
+            if previous_id and previous_id != survey.id:
+                current_surveys.pop(previous_id, None)
+            current = current_surveys.get(survey.id)
+            if current is not None and current.version == survey.version:
+                continue
+
+            self._versions.setdefault((survey.id, survey.version), survey)
+            current_surveys[survey.id] = self._versions[(survey.id, survey.version)]
+            self._archive(survey)
+            changed = True
+            logger.info(f"Загружен опрос {survey.id} версии {survey.version} ({name}, вопросов: {len(survey.questions)})")
+
+        if changed:
+            self._current = {survey.id: survey for survey in sorted(current_surveys.values(), key=self._order)}
+        return changed
+
+    def _order(self, survey: Survey) -> str:
+        return next((path for path, entry in self._files.items() if entry[2] == survey.id), "")
+
+    def _archive_path(self, survey_id: str, version: str) -> str:
+        return os.path.join(self.archive_dir, f"{survey_id}@{version}.json")
+
+    def _archive(self, survey: Survey):
+        if not self.archive_dir:
+            return
+        path = self._archive_path(survey.id, survey.version)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(survey.source)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить версию опроса {survey.id}@{survey.version}: {e}")
+
+    @property
+    def default(self) -> Survey | None:
+        """Опрос кнопки «Начать опрос»: default_id или первый по имени файла"""
+        return self._current.get(self.default_id) or next(iter(self._current.values()), None)
+
+    def active(self) -> list[Survey]:
+        return list(self._current.values())
+
+    def current(self, survey_id: str) -> Survey | None:
+        return self._current.get(survey_id)
+
+    def get(self, survey_id: str, version: str) -> Survey | None:
+        """Конкретная версия опроса: из памяти или из архива версий"""
+        survey = self._versions.get((survey_id, version))
+        if survey is not None or not self.archive_dir:
+            return survey
+        if not (SURVEY_ID_PATTERN.fullmatch(survey_id) and SURVEY_ID_PATTERN.fullmatch(version)):
+            return None
+        path = self._archive_path(survey_id, version)
+        try:
+            with open(path, encoding='utf-8') as f:
+                survey = compile_survey(json.load(f), survey_id, self.reserved_callbacks)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось загрузить версию опроса {survey_id}@{version} из архива: {e}")
+            return None
+        self._versions[(survey_id, version)] = survey
+        return survey
@@ -0,0 +1,162 @@
+"""Выгрузка завершенных опросов из локальной очереди отправки в CSV или Parquet.
+
+Опросы (данные format_survey_data) читаются из outbox пачками и сразу
+записываются, поэтому память не зависит от числа опросов. Одна строка -
+один опрос: время, название опроса, поля респондента, Telegram-пользователь
+и по колонке на каждый questionId.
+
+Запуск:
+    python tools/export_surveys.py responses.csv
+    python tools/export_surveys.py responses.parquet --since 2026-09-01 --until 2026-09-30 --filial Брест
+
+Parquet требует pyarrow (pip install pyarrow). Выгрузку можно делать при
+работающем боте: очередь хранится в SQLite в режиме WAL.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from outbox import SurveyOutbox
+
+# Колонки перед полями респондента и ответами
+LEADING_COLUMNS = ('createdAt', 'survey')
+TELEGRAM_COLUMNS = ('telegramId', 'telegramUserName')
+
+# Сколько строк писать в Parquet одной группой строк
+PARQUET_BATCH_SIZE = 5000
+
+
+def parse_date(value: str) -> float:
+    """Дата ГГГГ-ММ-ДД (местное время) -> unix time начала дня"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается дата ГГГГ-ММ-ДД: {value!r}")
+
+
+def select_surveys(outbox: SurveyOutbox, since: float | None, until: float | None, filials: set[str]):
+    """Опросы за период и по филиалам: (created_at, данные опроса)"""
+    for created_at, survey_data in outbox.iter_payloads(since, until):
+        if filials and survey_data.get('respondent', {}).get('filial') not in filials:
+            continue
+        yield created_at, survey_data
+
+
+def collect_columns(surveys) -> tuple[list[str], list[str]]:
+    """Поля респондента и questionId в порядке первого появления (первый проход по данным)"""
+    respondent_fields: dict[str, None] = {}
+    question_ids: dict[str, None] = {}
+    for _, survey_data in surveys:
+        for field in survey_data.get('respondent', {}):
+            if field != 'telegramUser':
+                respondent_fields.setdefault(field)
+        for answer in survey_data.get('response', {}).get('answers', ()):
+            question_ids.setdefault(answer.get('questionId'))
+    return list(respondent_fields), list(question_ids)
+
+
+def survey_rows(surveys, respondent_fields: list[str], question_ids: list[str]):
+    """Строки выгрузки: значения в порядке колонок, пропущенные ответы - пустые строки"""
+    for created_at, survey_data in surveys:
+        respondent = survey_data.get('respondent', {})
+        telegram_user = respondent.get('telegramUser') or {}
+        answers = {
+            answer.get('questionId'): answer.get('answerText', '')
+            for answer in survey_data.get('response', {}).get('answers', ())
+        }
+        yield [
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_at)),
+            survey_data.get('name', ''),
+            *(str(respondent.get(field, '')) for field in respondent_fields),
+            str(telegram_user.get('id', '')),
+            telegram_user.get('userName', ''),
+            *(answers.get(question_id, '') for question_id in question_ids)
+        ]
+
+
+def write_csv(path: str, columns: list[str], rows, delimiter: str) -> int:
+    # utf-8-sig - чтобы Excel сразу распознал кириллицу
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        writer.writerow(columns)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_parquet(path: str, columns: list[str], rows) -> int:
+    if pyarrow is None:
+        raise SystemExit("Для Parquet нужен pyarrow (pip install pyarrow)")
+    schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+
+    def write_batch(batch: list[list[str]]):
+        # Строки пачки -> колонки
+        arrays = [pyarrow.array(values, pyarrow.string()) for values in zip(*batch)]
+        writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                write_batch(batch)
+                count += len(batch)
+                batch.clear()
+        if batch:
+            write_batch(batch)
+            count += len(batch)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output', help="файл выгрузки (.csv или .parquet)")
+    parser.add_argument('--format', choices=('csv', 'parquet'), help="формат (по умолчанию - по расширению файла)")
+    parser.add_argument('--outbox', default=os.getenv('OUTBOX_PATH', os.path.join('data', 'outbox.sqlite3')),
+                        help="файл очереди отправки бота")
+    parser.add_argument('--since', type=parse_date, help="с даты ГГГГ-ММ-ДД включительно")
+    parser.add_argument('--until', type=parse_date, help="по дату ГГГГ-ММ-ДД включительно")
+    parser.add_argument('--filial', action='append', default=[], help="только этот филиал (можно несколько раз)")
+    parser.add_argument('--delimiter', default=',', help="разделитель CSV")
+    args = parser.parse_args()
+
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    if not os.path.isfile(args.outbox):
+        raise SystemExit(f"Очередь отправки {args.outbox} не найдена")
+    # По дату включительно - до начала следующего дня; опросы, записанные ботом во время
+    # выгрузки, не попадают в нее, и оба прохода видят одни и те же записи
+    until = (datetime.fromtimestamp(args.until) + timedelta(days=1)).timestamp() if args.until else time.time()
+    until = min(until, time.time())
+    filials = set(args.filial)
+
+    outbox = SurveyOutbox(args.outbox)
+    outbox.open()
+    try:
+        respondent_fields, question_ids = collect_columns(select_surveys(outbox, args.since, until, filials))
+        columns = [*LEADING_COLUMNS, *respondent_fields, *TELEGRAM_COLUMNS, *question_ids]
+        rows = survey_rows(select_surveys(outbox, args.since, until, filials), respondent_fields, question_ids)
+        if output_format == 'parquet':
+            count = write_parquet(args.output, columns, rows)
+        else:
+            count = write_csv(args.output, columns, rows, args.delimiter)
+    finally:
+        outbox.close()
+    print(f"Выгружено опросов: {count} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
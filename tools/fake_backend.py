@@ -0,0 +1,116 @@
+"""Локальная заглушка бэкенда опросов (edi1.savushkin.com:5050).
+
+Запуск: python tools/fake_backend.py --port 8082
+Затем в .env бота: API_BASE_URL=http://127.0.0.1:8082
+и, для пакетной отправки, API_BULK_SURVEYS_PATH=/bot/xr/surveys/add-batch
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_server import HTTPRequest, json_response, start_http_server
+
+AUTH_PATH = "/api/authentication/authenticate"
+SURVEYS_PATH = "/bot/xr/surveys/add"
+BULK_SURVEYS_PATH = "/bot/xr/surveys/add-batch"
+
+
+class FakeBackend:
+    """Принимает опросы как настоящий бэкенд, с настраиваемыми задержкой, сбоями и сроком жизни токена"""
+
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0, token_ttl: float = 3600,
+                 bulk: bool = True, save_path: str = ""):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.token_ttl = token_ttl
+        self.bulk = bulk
+        self.save_path = save_path
+        self.calls = Counter()
+        self.surveys_received = 0
+        self._tokens: dict[str, float] = {}
+        self._record_ids = itertools.count(1)
+
+    def _authorized(self, request: HTTPRequest) -> bool:
+        token = request.headers.get('authorization', '').removeprefix('Bearer ')
+        issued_at = self._tokens.get(token)
+        return issued_at is not None and time.monotonic() - issued_at < self.token_ttl
+
+    def _store(self, survey: dict) -> dict:
+        if self.fail_rate and random.random() < self.fail_rate:
+            return {"success": False, "message": "simulated failure"}
+        self.surveys_received += 1
+        if self.save_path:
+            with open(self.save_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(survey, ensure_ascii=False) + "\n")
+        return {"success": True, "id": next(self._record_ids), "message": "Survey saved"}
+
+    async def handle(self, request: HTTPRequest):
+        self.calls[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.method != 'POST':
+            return json_response({"message": "Method Not Allowed"}, 405)
+
+        if request.path == AUTH_PATH:
+            token = str(uuid.uuid4())
+            self._tokens[token] = time.monotonic()
+            return json_response({"uuid": token})
+
+        if request.path == SURVEYS_PATH or (request.path == BULK_SURVEYS_PATH and self.bulk):
+            if not self._authorized(request):
+                return json_response({"message": "Unauthorized"}, 401)
+            try:
+                payload = request.json()
+            except ValueError:
+                return json_response({"message": "Invalid JSON"}, 400)
+
+            if request.path == BULK_SURVEYS_PATH:
+                return json_response({"results": [self._store(survey) for survey in payload.get('surveys', [])]})
+
+            result = self._store(payload)
+            if not result["success"]:
+                return json_response({"message": result["message"]}, 500)
+            return json_response({"id": result["id"], "message": result["message"]})
+
+        return json_response({"message": "Not Found"}, 404)
+
+
+async def serve(host: str, port: int, backend: FakeBackend):
+    server = await start_http_server(backend.handle, host, port)
+    print(f"Заглушка бэкенда слушает http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"Запросы: {dict(backend.calls)}, сохранено опросов: {backend.surveys_received}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="доля опросов, отклоняемых с ошибкой")
+    parser.add_argument('--token-ttl', type=float, default=3600, help="срок жизни токена, секунды")
+    parser.add_argument('--no-bulk', action='store_true', help="не поддерживать пакетную отправку (404)")
+    parser.add_argument('--save', default="", help="дописывать принятые опросы в этот JSONL-файл")
+    args = parser.parse_args()
+
+    backend = FakeBackend(args.latency, args.fail_rate, args.token_ttl, not args.no_bulk, args.save)
+    try:
+        asyncio.run(serve(args.host, args.port, backend))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Локальная заглушка Telegram Bot API для проверки бота без подключения к Telegram.
+
+Запуск: python tools/fake_bot_api.py --port 8081
+Затем в .env бота: TELEGRAM_API_BASE_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_server import HTTPRequest, json_response, start_http_server
+
+BOT_USER = {
+    "id": 100000001,
+    "is_bot": True,
+    "first_name": "Fake Survey Bot",
+    "username": "fake_survey_bot",
+    "can_join_groups": False,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False
+}
+
+# Методы, которые возвращают отправленное или измененное сообщение
+MESSAGE_METHODS = {'sendMessage', 'editMessageText', 'editMessageReplyMarkup'}
+
+
+class FakeBotAPI:
+    """Отвечает на вызовы Bot API правдоподобными результатами и считает их"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_ids = itertools.count(1000)
+
+    def _message(self, params: dict) -> dict:
+        chat_id = int(params.get('chat_id') or 0)
+        message_id = int(params.get('message_id') or next(self._message_ids))
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get('text', '')
+        }
+        if params.get('reply_markup'):
+            reply_markup = params['reply_markup']
+            message["reply_markup"] = json.loads(reply_markup) if isinstance(reply_markup, str) else reply_markup
+        return message
+
+    async def handle(self, request: HTTPRequest):
+        # Путь вида /bot<token>/<method>
+        _, _, method = request.path.rpartition('/')
+        if not request.path.startswith('/bot') or not method:
+            return json_response({"ok": False, "error_code": 404, "description": "Not Found"}, 404)
+
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = request.form()
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in MESSAGE_METHODS:
+            result = self._message(params)
+        elif method == 'getUpdates':
+            # Обновления приходят только через вебхук; имитируем пустой long polling
+            await asyncio.sleep(min(float(params.get('timeout') or 0), 1.0))
+            result = []
+        else:
+            result = True
+        return json_response({"ok": True, "result": result})
+
+
+async def serve(host: str, port: int, latency: float):
+    api = FakeBotAPI(latency)
+    server = await start_http_server(api.handle, host, port)
+    print(f"Заглушка Bot API слушает http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"Вызовы Bot API: {dict(api.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="искусственная задержка ответа, секунды")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.latency))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""Нагрузочный прогон бота на заглушках Bot API и бэкенда.
+
+Настоящий Application из bot.py работает с tools/fake_bot_api.py и tools/fake_backend.py,
+поднятыми в этом же процессе в отдельном потоке со своим событийным циклом,
+чтобы обработка запросов заглушками не отнимала время у бота и не искажала
+задержки; обновления подаются прямо в очередь приложения. Рабочий каталог
+прогона (очередь отправки, сессии, логи) удаляется по завершении, если не
+указан --keep-workdir.
+Опросы либо воспроизводятся из журнала шагов (logs/survey_events.jsonl),
+либо синтезируются обходом скомпилированного описания опроса по умолчанию
+(bot.surveys.default: кнопки вопросов и переходы между ними).
+
+Запуск:
+    python tools/load_test.py --users 200 --rate 20
+    python tools/load_test.py --replay logs/survey_events.jsonl --users 500 --speed 10
+
+Лимиты Bot API, пакетная отправка и т.п. берутся из переменных окружения бота
+(например, BOT_API_CHAT_RATE=1000 снимает ограничение на чат).
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+from http_server import start_http_server
+from fake_backend import BULK_SURVEYS_PATH, FakeBackend
+from fake_bot_api import FakeBotAPI
+
+# Текстовые ответы синтезированных опросов
+SAMPLE_ANSWERS = [
+    "Инженер-технолог",
+    "Начальник смены",
+    "Не хватает опыта руководства",
+    "Больше обучения и наставничества",
+    "Производство",
+    "Мастер участка",
+    "БГТУ",
+    "Нет"
+]
+SAMPLE_NAMES = ["Иванов Иван Иванович", "Петрова Анна Сергеевна", "Ковалёв Дмитрий"]
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Тест", "language_code": "ru"},
+        "text": text
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест", "language_code": "ru"},
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "..."
+            }
+        }
+    }
+
+
+def load_streams(path: str) -> list[list[tuple[str, str, float]]]:
+    """Читает журнал шагов: для каждого пользователя список (input, data, пауза перед шагом)"""
+    streams: dict[int, list] = defaultdict(list)
+    last_ts: dict[int, float] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event.get('data') is None or event.get('user') is None:
+                continue
+            user = event['user']
+            gap = event['ts'] - last_ts[user] if user in last_ts else 0.0
+            last_ts[user] = event['ts']
+            streams[user].append((event['input'], event['data'], gap))
+    return list(streams.values())
+
+
+def synthesize_stream(bot, rng: random.Random, think: float, yes_share: float) -> list[tuple[str, str, float]]:
+    """Проходит опрос по умолчанию по его описанию со случайными ответами"""
+    survey = bot.surveys.default
+    steps = [('text', '/start'), ('callback', bot.START_SURVEY_CALLBACK)]
+    branch = None
+
+    question_key = survey.first_question
+    while question_key:
+        question = survey.questions[question_key]
+        answer = '*'
+        if question.type == 'consent':
+            steps.append(('callback', question.callback_for('answer', 'yes')))
+        elif question.type == 'yes_no':
+            answer = 'yes' if rng.random() < yes_share else 'no'
+            steps.append(('callback', question.callback_for('answer', answer)))
+        elif question.type == 'choice':
+            answer = rng.choice(question.options)
+            steps.append(('callback', question.callback_for('answer', answer)))
+        elif question.type == 'multi_choice':
+            chosen = rng.sample(question.options, rng.randint(1, min(3, len(question.options))))
+            for option in chosen:
+                steps.append(('callback', question.callback_for('toggle', option)))
+            steps.append(('callback', question.finish_callback))
+            if question.other_option in chosen:
+                answer = 'other'
+        elif question.type == 'tab_number':
+            steps.append(('text', str(rng.randint(1000, 99999))))
+        elif question_key == 'fio':
+            steps.append(('text', rng.choice(SAMPLE_NAMES)))
+        else:
+            steps.append(('text', rng.choice(SAMPLE_ANSWERS)))
+
+        if question_key == survey.branch_question:
+            branch = answer
+        if (question_key, answer) in survey.exits:
+            break
+        question_key = survey.next_question(question_key, branch, answer)
+
+    return [(kind, data, think) for kind, data in steps]
+
+
+class LatencyCollector(logging.Handler):
+    """Собирает время обработки шагов из журнала шагов бота"""
+
+    def __init__(self):
+        super().__init__()
+        self.latencies: list[float] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.latencies.append(json.loads(record.getMessage())['latency_ms'])
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+class StubServers:
+    """HTTP-заглушки в отдельном потоке со своим событийным циклом"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='load-test-stubs', daemon=True)
+        self.servers: list[asyncio.AbstractServer] = []
+
+    def start(self):
+        self.thread.start()
+
+    def serve(self, handler) -> int:
+        """Запускает сервер с обработчиком handler, возвращает его порт"""
+        server = asyncio.run_coroutine_threadsafe(start_http_server(handler, '127.0.0.1', 0), self.loop).result()
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        async def close_servers():
+            for server in self.servers:
+                server.close()
+                await server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close_servers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+async def run(args) -> dict:
+    backend = FakeBackend(latency=args.backend_latency)
+    bot_api = FakeBotAPI(latency=args.api_latency)
+    stubs = StubServers()
+    stubs.start()
+    try:
+        return await run_bot(args, backend, bot_api, stubs.serve(backend.handle), stubs.serve(bot_api.handle))
+    finally:
+        stubs.stop()
+
+
+async def run_bot(args, backend: FakeBackend, bot_api: FakeBotAPI, backend_port: int, bot_api_port: int) -> dict:
+
+    # Настройки бота читаются при импорте - задаем их заранее
+    os.environ.update(
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{bot_api_port}",
+        API_BASE_URL=f"http://127.0.0.1:{backend_port}",
+        OUTBOX_PATH=os.path.join(args.workdir, 'outbox.sqlite3'),
+        SESSIONS_PATH=os.path.join(args.workdir, 'sessions.sqlite3'),
+        SURVEY_EVENTS_PATH=args.events or ''
+    )
+    os.environ.setdefault('BOT_TOKEN', '123456:LOAD-TEST')
+    os.environ.setdefault('API_USERNAME', 'load-test')
+    os.environ.setdefault('API_PASSWORD', 'load-test')
+    os.environ.setdefault('API_BULK_SURVEYS_PATH', BULK_SURVEYS_PATH)
+    # Эндпоинт метрик не запускаем, чтобы не занять порт работающего бота
+    os.environ.setdefault('METRICS_PORT', '0')
+    bot = importlib.import_module('bot')
+    bot.logger.setLevel(args.log_level)
+
+    collector = LatencyCollector()
+    bot.event_log.addHandler(collector)
+
+    rng = random.Random(args.seed)
+    if args.replay:
+        recorded = load_streams(args.replay)
+        if not recorded:
+            raise SystemExit(f"В {args.replay} нет шагов для воспроизведения")
+        users = args.users or len(recorded)
+        streams = [[(kind, data, gap / args.speed if args.speed > 0 else 0.0) for kind, data, gap in recorded[i % len(recorded)]]
+                   for i in range(users)]
+    else:
+        users = args.users or 100
+        streams = [synthesize_stream(bot, rng, args.think, args.yes_share) for _ in range(users)]
+    expected = sum(1 for stream in streams if ('callback', 'start_survey') in [(kind, data) for kind, data, _ in stream])
+
+    application = bot.build_application()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+    update_ids = itertools.count(1)
+
+    async def virtual_user(user_id: int, stream):
+        for kind, data, gap in stream:
+            if gap:
+                await asyncio.sleep(min(gap, args.max_gap))
+            update_id = next(update_ids)
+            payload = callback_update(update_id, user_id, data) if kind == 'callback' else message_update(update_id, user_id, data)
+            await application.update_queue.put(Update.de_json(payload, application.bot))
+
+    async def arrivals():
+        tasks = []
+        for index, stream in enumerate(streams):
+            tasks.append(asyncio.create_task(virtual_user(args.first_user_id + index, stream)))
+            if args.rate > 0:
+                await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*tasks)
+
+    print(f"Пользователей: {users}, шагов: {sum(len(stream) for stream in streams)}, ожидается опросов: {expected}")
+    started = time.perf_counter()
+    feeder = asyncio.create_task(arrivals())
+
+    # Ждем, пока бэкенд получит все опросы или прогресс остановится
+    progress = []
+    last_change = started
+    last_count = 0
+    while True:
+        await asyncio.sleep(0.05)
+        now = time.perf_counter()
+        count = backend.surveys_received
+        if count != last_count:
+            progress.append((now - started, count))
+            last_count, last_change = count, now
+        if count >= expected and feeder.done():
+            break
+        if now - last_change > args.idle_timeout and feeder.done():
+            print(f"Нет прогресса {args.idle_timeout:.0f} с, останавливаемся")
+            break
+    elapsed = (progress[-1][0] if progress else time.perf_counter() - started)
+    await feeder
+
+    await application.stop()
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+    # Установившаяся скорость - между 10% и 90% доставленных опросов
+    steady = None
+    if len(progress) > 2 and expected:
+        low = next((t for t, c in progress if c >= expected * 0.1), None)
+        high = next((t for t, c in progress if c >= expected * 0.9), None)
+        if low is not None and high is not None and high > low:
+            steady = expected * 0.8 / (high - low)
+
+    latencies = collector.latencies
+    return {
+        'users': users,
+        'steps': len(latencies),
+        'surveys_expected': expected,
+        'surveys_delivered': backend.surveys_received,
+        'elapsed_seconds': round(elapsed, 3),
+        'surveys_per_second': round(backend.surveys_received / elapsed, 2) if elapsed else 0.0,
+        'steady_surveys_per_second': round(steady, 2) if steady else None,
+        'step_latency_ms': {
+            'mean': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies, default=0.0)
+        },
+        'bot_api_calls': dict(bot_api.calls),
+        'backend_calls': dict(backend.calls),
+        'bot_api_rate_limiter': bot.bot_rate_limiter.stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replay', help="журнал шагов (JSONL) для воспроизведения; без него опросы синтезируются")
+    parser.add_argument('--users', type=int, default=0, help="число виртуальных пользователей")
+    parser.add_argument('--rate', type=float, default=0.0, help="новых пользователей в секунду (0 - все сразу)")
+    parser.add_argument('--think', type=float, default=0.2, help="пауза между шагами синтезированного опроса, секунды")
+    parser.add_argument('--speed', type=float, default=1.0, help="ускорение пауз при воспроизведении (0 - без пауз)")
+    parser.add_argument('--max-gap', type=float, default=5.0, help="максимальная пауза между шагами, секунды")
+    parser.add_argument('--yes-share', type=float, default=0.8, help="доля ответов «Да» в синтезированных опросах")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--first-user-id', type=int, default=10_000_000)
+    parser.add_argument('--api-latency', type=float, default=0.0, help="задержка заглушки Bot API, секунды")
+    parser.add_argument('--backend-latency', type=float, default=0.0, help="задержка заглушки бэкенда, секунды")
+    parser.add_argument('--idle-timeout', type=float, default=30.0)
+    parser.add_argument('--events', help="записать журнал шагов этого прогона в файл")
+    parser.add_argument('--log-level', default='WARNING', help="уровень логов бота в консоли")
+    parser.add_argument('--output', help="сохранить результат в JSON")
+    parser.add_argument('--keep-workdir', action='store_true', help="не удалять рабочий каталог прогона")
+    args = parser.parse_args()
+
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    if args.events:
+        args.events = os.path.abspath(args.events)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    # Логи, очередь отправки и сессии прогона не смешиваются с рабочими
+    args.workdir = tempfile.mkdtemp(prefix='survey_load_')
+    cwd = os.getcwd()
+    os.chdir(args.workdir)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        os.chdir(cwd)
+        if args.keep_workdir:
+            print(f"Рабочий каталог прогона: {args.workdir}")
+        else:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
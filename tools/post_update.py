@@ -0,0 +1,41 @@
+"""Отправляет записанные Update JSON на вебхук бота (режим BOT_MODE=webhook).
+
+Запуск: python tools/post_update.py tools/samples/start_command.json tools/samples/start_survey_click.json
+Адрес и секрет берутся из WEBHOOK_* в .env или из аргументов.
+"""
+import argparse
+import json
+import os
+import sys
+
+import httpx
+from dotenv import load_dotenv
+
+
+def main():
+    load_dotenv()
+    port = os.getenv('WEBHOOK_PORT', '8443')
+    path = os.getenv('WEBHOOK_PATH', '/telegram')
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help="файлы с Update JSON (объект или список объектов)")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{port}{path}")
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET', ''))
+    args = parser.parse_args()
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret}
+    failed = 0
+    with httpx.Client(timeout=10) as client:
+        for filename in args.files:
+            with open(filename, encoding='utf-8') as f:
+                updates = json.load(f)
+            for update in updates if isinstance(updates, list) else [updates]:
+                response = client.post(args.url, json=update, headers=headers)
+                print(f"{filename} update_id={update.get('update_id')}: {response.status_code}")
+                failed += response.status_code != 200
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
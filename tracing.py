@@ -0,0 +1,170 @@
+import asyncio
+import cProfile
+import logging
+import os
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger('survey_bot.tracing')
+
+# Трассировка обновления, которое обрабатывается в текущей задаче
+_current_trace: ContextVar['Trace | None'] = ContextVar('current_trace', default=None)
+
+# Функции (имя участка, секунды), вызываемые по завершении каждого участка - например, для метрик
+span_observers = []
+
+_NO_SPAN = nullcontext()
+
+
+class Trace:
+    """Участки (spans) обработки одного обновления: имя, смещение от начала, длительность, вложенность"""
+
+    __slots__ = ('name', 'started', 'finished', 'spans', 'depth')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished = None
+        self.spans: list[tuple[str, float, float, int]] = []
+        self.depth = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def add(self, name: str, started: float, duration: float, depth: int):
+        # Задачи, запущенные из обработчика, могут закончиться позже него - их участки не нужны
+        if self.finished is None:
+            self.spans.append((name, started - self.started, duration, depth))
+        for observer in span_observers:
+            observer(name, duration)
+
+    def totals_ms(self) -> dict[str, float]:
+        """Суммарное время по именам участков, миллисекунды"""
+        totals: dict[str, float] = {}
+        for name, _, duration, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return {name: round(duration * 1000, 2) for name, duration in totals.items()}
+
+    def summary(self) -> str:
+        """Одна строка: участки в порядке начала, вложенные отмечены точками"""
+        spans = sorted(self.spans, key=lambda span: span[1])
+        parts = [f"{'.' * (depth - 1)}{name} {duration * 1000:.0f}" for name, _, duration, depth in spans]
+        return f"{self.name} {self.duration * 1000:.0f} мс: " + ", ".join(parts)
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started', 'depth')
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.trace.depth += 1
+        self.depth = self.trace.depth
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.started
+        self.trace.depth -= 1
+        self.trace.add(self.name, self.started, duration, self.depth)
+        return False
+
+
+class _TraceScope:
+    __slots__ = ('trace', 'token')
+
+    def __init__(self, name: str):
+        self.trace = Trace(name)
+
+    def __enter__(self) -> Trace:
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc_info):
+        self.trace.finished = time.perf_counter()
+        _current_trace.reset(self.token)
+        return False
+
+
+def trace(name: str) -> _TraceScope:
+    """Начинает трассировку обновления: with trace("handle_message") as t: ..."""
+    return _TraceScope(name)
+
+
+def span(name: str):
+    """Участок внутри текущей трассировки; вне трассировки ничего не делает"""
+    current = _current_trace.get()
+    if current is None:
+        return _NO_SPAN
+    return _Span(current, name)
+
+
+def add_span(name: str, duration: float):
+    """Добавляет уже измеренный участок (например, ожидание в очереди), закончившийся сейчас"""
+    current = _current_trace.get()
+    if current is not None:
+        current.add(name, time.perf_counter() - duration, duration, current.depth + 1)
+
+
+def traced(name: str | None = None):
+    """Декоратор: выполнение асинхронной функции - отдельный участок трассировки"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SampledProfiler:
+    """Профилирует каждое every-е обновление под cProfile и пишет профиль в directory.
+
+    cProfile видит весь поток, поэтому в профиль попадает и работа других
+    обновлений, выполнявшихся одновременно. Одновременно профилируется
+    не больше одного обновления. every можно менять на лету, 0 - выключено.
+    """
+
+    def __init__(self, every: int, directory: str):
+        self.every = every
+        self.directory = directory
+        self._counter = 0
+        self._active: cProfile.Profile | None = None
+
+    def start(self) -> cProfile.Profile | None:
+        if self.every <= 0 or self._active is not None:
+            return None
+        self._counter += 1
+        if self._counter % self.every:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Профилировщик уже включен кем-то еще
+            return None
+        self._active = profile
+        return profile
+
+    def stop(self, profile: cProfile.Profile | None, label: str):
+        if profile is None:
+            return
+        profile.disable()
+        self._active = None
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d_%H%M%S')}_{label}.prof")
+        # Запись на диск - вне событийного цикла
+        asyncio.get_running_loop().run_in_executor(None, self._dump, profile, path)
+
+    def _dump(self, profile: cProfile.Profile, path: str):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить профиль {path}: {e}")
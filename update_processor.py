@@ -0,0 +1,77 @@
+import asyncio
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    Обновления разных пользователей обрабатываются одновременно (не более
+    max_concurrent_updates), а обновления одного пользователя - строго по очереди,
+    чтобы обработчики не гонялись за context.user_data.
+    """
+
+    # Лимит базового класса: его семафор берется до do_process_update, то есть до очереди
+    # пользователя, поэтому он не должен ограничивать - ограничивает собственный семафор
+    _UNBOUNDED = 1 << 30
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates должно быть положительным")
+        self._limit = self._UNBOUNDED
+        super().__init__(self._UNBOUNDED)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        # user_id -> [lock, число ожидающих/выполняющихся обновлений]
+        self._user_locks: dict[int, list] = {}
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    @property
+    def current_concurrent_updates(self) -> int:
+        return self._running
+
+    @staticmethod
+    def _user_key(update: object) -> int | None:
+        if isinstance(update, Update) and update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Сначала - очередь пользователя, и только внутри нее - общий лимит: обновления,
+        # ждущие своей очереди, не занимают места max_concurrent_updates
+        user_id = self._user_key(update)
+        if user_id is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._user_locks.get(user_id)
+        if entry is None:
+            entry = self._user_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[user_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._user_locks.clear()
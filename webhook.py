@@ -0,0 +1,81 @@
+import asyncio
+import hmac
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HTTPRequest, json_response, start_http_server, text_response
+
+logger = logging.getLogger('survey_bot.webhook')
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+def make_webhook_handler(application: Application, path: str, secret_token: str):
+    """Обработчик HTTP-запросов от Telegram: проверяет секрет и ставит Update в очередь приложения"""
+    expected_secret = secret_token.encode('utf-8')
+
+    async def handle(request: HTTPRequest):
+        if request.path != path:
+            return text_response("Not Found", 404)
+        if request.method != 'POST':
+            return text_response("Method Not Allowed", 405)
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, '').encode('utf-8'), expected_secret):
+            logger.warning("Отклонен запрос к вебхуку с неверным секретным токеном")
+            return text_response("Forbidden", 403)
+
+        try:
+            update = Update.de_json(request.json(), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное обновление в вебхуке: {e}")
+            return text_response("Bad Request", 400)
+        if update is None:
+            return text_response("Bad Request", 400)
+
+        await application.update_queue.put(update)
+        return json_response({"ok": True})
+
+    return handle
+
+
+async def run_webhook(application: Application, listen: str, port: int, path: str,
+                      secret_token: str, webhook_url: str = ""):
+    """Запускает приложение в режиме вебхука на встроенном HTTP-сервере.
+
+    Если задан webhook_url, адрес регистрируется в Telegram. Без него сервер
+    только принимает обновления - так его можно проверить локально, отправляя
+    записанные Update JSON (см. tools/post_update.py).
+    """
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    server = None
+    try:
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Вебхук зарегистрирован: {webhook_url}")
+
+        await application.start()
+        server = await start_http_server(make_webhook_handler(application, path, secret_token), listen, port)
+        logger.info(f"Вебхук слушает http://{listen}:{port}{path}")
+        print(f"Вебхук слушает http://{listen}:{port}{path}")
+
+        # Работаем до Ctrl+C (отмены задачи)
+        await asyncio.Event().wait()
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)